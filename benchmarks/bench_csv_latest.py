@@ -0,0 +1,113 @@
+"""
+Benchmark: reading a page of recordings from the CSV backend, with the sidecar offset index (CSVDatabase) vs parsing
+the whole file (what CSVDatabase did before the index). Reports ms per read for the newest page, the newest page of one
+identifier, a page further down (keyset cursor) and rows by recording id.
+
+Writes its recordings to a temporary directory: at the default 100k rows (chat-history sized) that is about 1 GB.
+Usage: python benchmarks/bench_csv_latest.py [--rows 100000] [--page-size 100] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from paramount.server.db_connector.csv import CSVDatabase  # noqa: E402
+
+TABLE = 'paramount_data'
+BATCH = 10000
+
+
+def make_rows(start, n):
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': ('lorem ipsum dolor sit amet ' * 20)[:500]}
+               for i in range(20)]
+    return pd.DataFrame([{'paramount__evaluation': 'accepted' if (start + i) % 50 == 0 else '',
+                          'paramount__recording_id': str(uuid.uuid4()),
+                          'paramount__recorded_at': base + timedelta(seconds=start + i),
+                          'paramount__function_name': 'answer',
+                          'input_args__company_uuid': f'company-{(start + i) % 20}',
+                          'input_args__message_history': history,
+                          'output__1_answer': 'We are open from 9 to 5.'}
+                         for i in range(n)])
+
+
+def full_scan(page_size, company=None):
+    """The old path: parse everything, filter and sort in pandas."""
+    df = pd.read_csv(TABLE + '.csv')
+    if company:
+        df = df[df['input_args__company_uuid'] == company]
+    recorded_at = pd.to_datetime(df['paramount__recorded_at'], utc=True)
+    df = df.assign(_recorded_at=recorded_at)
+    return df.sort_values(['_recorded_at', 'paramount__recording_id'], ascending=False).head(page_size)
+
+
+def timed(func, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best * 1000
+
+
+def run(rows, page_size):
+    db = CSVDatabase()
+    for start in range(0, rows, BATCH):
+        db.create_or_append(make_rows(start, min(BATCH, rows - start)), TABLE)
+    size_mb = os.path.getsize(TABLE + '.csv') / 1e6
+
+    first_page = db.get_recordings(TABLE, False, False, page_size=page_size)
+    last_row = first_page.iloc[-1]
+    cursor = (datetime.fromisoformat(last_row['paramount__recorded_at']), last_row['paramount__recording_id'])
+    ids = first_page['paramount__recording_id'].sample(10, random_state=0).tolist()
+
+    cases = {
+        'latest': lambda: db.get_recordings(TABLE, False, False, page_size=page_size),
+        'latest_one_id': lambda: db.get_recordings(TABLE, False, True, 'input_args__company_uuid', 'company-7',
+                                                   page_size=page_size),
+        'latest_evaluated': lambda: db.get_recordings(TABLE, True, False, page_size=page_size),
+        'next_page': lambda: db.get_recordings(TABLE, False, False, page_size=page_size, cursor=cursor),
+        'by_recording_ids': lambda: db.get_recordings(TABLE, False, False, recording_ids=ids),
+    }
+    results = [{'case': name, 'path': 'indexed', 'rows': rows, 'file_mb': size_mb, 'ms': timed(func, 5)}
+               for name, func in cases.items()]
+    results.append({'case': 'latest', 'path': 'full_scan', 'rows': rows, 'file_mb': size_mb,
+                    'ms': timed(lambda: full_scan(page_size), 1)})
+    results.append({'case': 'latest_one_id', 'path': 'full_scan', 'rows': rows, 'file_mb': size_mb,
+                    'ms': timed(lambda: full_scan(page_size, 'company-7'), 1)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='recordings in the table')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    workdir, cwd = tempfile.mkdtemp(prefix='paramount-bench-'), os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run(args.rows, args.page_size)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<18}{'path':<11}{'rows':>9}{'file MB':>10}{'ms':>11}")
+        for r in results:
+            print(f"{r['case']:<18}{r['path']:<11}{r['rows']:>9}{r['file_mb']:>10.0f}{r['ms']:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
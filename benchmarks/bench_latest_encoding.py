@@ -0,0 +1,98 @@
+"""
+Benchmark: encoding a page of recordings for /api/latest, as records (jsonify, the default), columns and arrow,
+each with and without gzip/brotli. Reports the time to encode and compress, and the bytes sent.
+
+Runs on a synthetic page (chat-history sized inputs), no database needed. arrow and brotli are skipped when
+pyarrow / brotli are not installed.
+Usage: python benchmarks/bench_latest_encoding.py [--rows 100] [--json]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from flask import Flask, jsonify  # noqa: E402
+from paramount.server.encoding import (arrow_ipc, brotli, clean_none_strings, columns_json,  # noqa: E402
+                                       BROTLI_QUALITY, GZIP_LEVEL)
+
+
+def make_page(rows):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': ('lorem ipsum dolor sit amet ' * 20)[:500]}
+               for i in range(50)]
+    return pd.DataFrame([{'paramount__recording_id': str(uuid.uuid4()),
+                          'paramount__evaluation': None,
+                          'paramount__recorded_at': now,
+                          'paramount__evaluated_at': now,
+                          'paramount__function_name': 'answer',
+                          'paramount__execution_time': 0.5,
+                          'input_args__company_uuid': '5f0c6a5e-0b8e-4a43-9a1c-2a0c1b5f9d11',
+                          'input_args__message_history': history,
+                          'input_args__new_question': 'What are your opening hours?',
+                          'output__1_answer': 'We are open from 9 to 5.',
+                          'output__1_based_on': [{'title': 'Opening hours', 'source_id': 'doc-1'}]}
+                         for _ in range(rows)])
+
+
+def best_of(func, rounds=5):
+    best, result = float('inf'), None
+    for _ in range(rounds):
+        start = perf_counter()
+        result = func()
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+def run(rows):
+    page = make_page(rows)
+    app = Flask(__name__)
+
+    def records():
+        with app.app_context():
+            df = clean_none_strings(page.copy())
+            return jsonify({'result': df.to_dict(orient='records'), 'column_order': df.columns.tolist()}).get_data()
+
+    encoders = {'records': records, 'columns': lambda: columns_json(clean_none_strings(page.copy())).encode()}
+    try:
+        import pyarrow  # noqa: F401
+        encoders['arrow'] = lambda: arrow_ipc(clean_none_strings(page.copy()))
+    except ImportError:
+        pass
+
+    compressors = {'none': lambda data: data, 'gzip': lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL)}
+    if brotli is not None:
+        compressors['br'] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+
+    results = []
+    for encoder_name, encode in encoders.items():
+        for compressor_name, compress in compressors.items():
+            seconds, body = best_of(lambda: compress(encode()))
+            results.append({'format': encoder_name, 'compression': compressor_name, 'rows': rows,
+                            'ms': seconds * 1000, 'bytes': len(body)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100, help='rows per page')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = run(args.rows)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'format':<9}{'compression':<13}{'ms':>9}{'bytes':>12}")
+        for r in results:
+            print(f"{r['format']:<9}{r['compression']:<13}{r['ms']:>9.2f}{r['bytes']:>12}")
+
+
+if __name__ == '__main__':
+    main()
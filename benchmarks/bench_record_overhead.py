@@ -0,0 +1,89 @@
+"""
+Micro-benchmark: how much time does the record() decorator add to each call, on top of the bare function?
+
+Runs in a throwaway directory with a CSV backend, so nothing touches your paramount.toml or database.
+Usage: python benchmarks/bench_record_overhead.py [--calls 20000] [--json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import toml
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from paramount.server.library_functions import default_config  # noqa: E402
+
+
+def small_args():
+    return (), {'company_uuid': '5f0c6a5e-0b8e-4a43-9a1c-2a0c1b5f9d11', 'new_question': 'What are your opening hours?'}
+
+
+def large_args():
+    # Chat-history sized input: 50 turns of ~500 characters each
+    history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': ('lorem ipsum dolor sit amet ' * 20)[:500]}
+               for i in range(50)]
+    return (), {'company_uuid': '5f0c6a5e-0b8e-4a43-9a1c-2a0c1b5f9d11', 'message_history': history,
+                'new_question': 'And on Sundays?'}
+
+
+def bare_function(**kwargs):
+    return {'answer': 'We are open from 9 to 5.', 'based_on': [{'title': 'Opening hours', 'source_id': 'doc-1'}]},
+
+
+def time_calls(func, args, kwargs, calls):
+    best = float('inf')
+    for _ in range(5):  # Best of 5 rounds, to filter out scheduler noise
+        start = perf_counter()
+        for _ in range(calls):
+            func(*args, **kwargs)
+        best = min(best, (perf_counter() - start) / calls)
+    return best
+
+
+def run(calls):
+    workdir = tempfile.mkdtemp(prefix='paramount-bench-')
+    os.chdir(workdir)
+    config = default_config()
+    config['record']['queue_size'] = calls * 10 + 1  # Never drop during the benchmark: measure the full hot path
+    with open('paramount.toml', 'w') as f:
+        toml.dump(config, f)
+    os.environ['PARAMOUNT_CONFIG_FILE'] = os.path.join(workdir, 'paramount.toml')
+
+    from paramount.server.record import record
+    from paramount.server import writer
+    with contextlib.redirect_stdout(sys.stderr):  # Keep paramount's startup prints out of the results
+        recorded_function = record(Flask(__name__))(bare_function)
+
+    results = []
+    for name, make_args in (('small', small_args), ('large', large_args)):
+        args, kwargs = make_args()
+        bare = time_calls(bare_function, args, kwargs, calls)
+        recorded = time_calls(recorded_function, args, kwargs, calls)
+        results.append({'case': name, 'calls': calls, 'bare_us': bare * 1e6, 'recorded_us': recorded * 1e6,
+                        'overhead_us': (recorded - bare) * 1e6})
+    writer.flush_writers(60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000, help='calls per timing round')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = run(args.calls)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<8}{'bare (us)':>12}{'recorded (us)':>16}{'overhead (us)':>16}")
+        for r in results:
+            print(f"{r['case']:<8}{r['bare_us']:>12.2f}{r['recorded_us']:>16.2f}{r['overhead_us']:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Import-time regression check: instrumenting an app with record() must not import pandas, numpy, the database
+backends (SQLAlchemy, psycopg2) or scikit-learn, which would add seconds to the cold start of the app's hosts. The
+paramount API may import pandas, but scikit-learn only on the first /api/similarity request.
+
+Each case runs in a fresh interpreter under `python -X importtime`, from an empty directory (so with the default
+config), and fails when it imports a forbidden module or takes longer than its budget. Exits 1 on any failure.
+Usage: python benchmarks/check_import_time.py [--budget-scale 1.0] [--json]   (or make check-imports)
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ['pandas', 'numpy', 'pyarrow', 'sqlalchemy', 'psycopg2', 'sklearn', 'scipy']
+
+DECORATE = '''
+import flask
+from paramount import record
+
+@record(flask.Flask(__name__))
+def answer(question):
+    return question
+'''
+
+# name, code, forbidden top-level modules, budget in ms (cumulative import time of the code's imports)
+CASES = [
+    ('import paramount', 'import paramount', HEAVY, 400),
+    ('record() a function', DECORATE, HEAVY, 400),
+    ('import paramount.server.api', 'import paramount.server.api', ['sklearn', 'scipy', 'sqlalchemy', 'psycopg2'],
+     1500),
+]
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_times(code, workdir):
+    """{module: cumulative microseconds} of the modules imported while running code, and its outermost imports."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    run = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir, env=env,
+                         capture_output=True, text=True)
+    if run.returncode != 0:
+        raise RuntimeError(f"{code!r} failed: {run.stderr[-2000:]}")
+    modules, outermost = {}, []
+    for line in run.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+            if len(match.group(3)) == 1:
+                outermost.append(match.group(4))
+    return modules, outermost
+
+
+def check(name, code, forbidden, budget_ms, workdir):
+    # The interpreter's own startup imports (site, encodings, ...) happen before -c runs: they are not counted
+    _, startup = import_times('pass', workdir)
+    modules, outermost = import_times(code, workdir)
+    total_ms = sum(modules[module] for module in outermost if module not in startup) / 1000
+    imported = sorted({module.split('.')[0] for module in modules} & set(forbidden))
+    return {'case': name, 'ms': total_ms, 'budget_ms': budget_ms, 'forbidden_imported': imported,
+            'ok': not imported and total_ms <= budget_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='multiply the time budgets, eg. on slow CI')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='paramount-imports-')
+    try:
+        results = [check(name, code, forbidden, budget_ms * args.budget_scale, workdir)
+                   for name, code, forbidden, budget_ms in CASES]
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<30}{'ms':>9}{'budget':>9}  result")
+        for r in results:
+            result = 'ok' if r['ok'] else 'FAIL' + (f" (imports {', '.join(r['forbidden_imported'])})"
+                                                    if r['forbidden_imported'] else ' (too slow)')
+            print(f"{r['case']:<30}{r['ms']:>9.1f}{r['budget_ms']:>9.0f}  {result}")
+    raise SystemExit(0 if all(r['ok'] for r in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare two benchmark suite results (see benchmarks/suite.py): every metric measured in both runs, with its relative
+change. A change beyond --threshold in the wrong direction (eg. higher latency, lower rows/sec) is a regression.
+
+Exits with status 1 when there is a regression, so it can gate CI.
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 0.25] [--json]
+"""
+import argparse
+import json
+
+MACHINE_KEYS = ('python', 'platform', 'machine', 'cpu_count', 'packages')
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report['meta'], {(r['suite'], r['case'], r['size'], r['metric']): r for r in report['results']}
+
+
+def compare(baseline, candidate, threshold):
+    rows = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        base, new = baseline[key], candidate[key]
+        change = new['value'] / base['value'] - 1 if base['value'] else 0.0
+        worse = change if base['better'] == 'lower' else -change  # > 0 when the candidate is slower
+        status = 'regression' if worse > threshold else 'improvement' if worse < -threshold else 'same'
+        rows.append({'suite': key[0], 'case': key[1], 'size': key[2], 'metric': key[3], 'unit': base['unit'],
+                     'baseline': base['value'], 'candidate': new['value'], 'change': change, 'status': status})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline', help='results JSON of the reference run')
+    parser.add_argument('candidate', help='results JSON of the run to check')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change ignored as noise: ms-scale latencies easily vary by 10-20%% between runs')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    baseline_meta, baseline = load(args.baseline)
+    candidate_meta, candidate = load(args.candidate)
+    rows = compare(baseline, candidate, args.threshold)
+    # Numbers from different machines or dependency versions mostly measure those differences
+    differences = [key for key in MACHINE_KEYS if baseline_meta.get(key) != candidate_meta.get(key)]
+    only_in_one = sorted(baseline.keys() ^ candidate.keys())
+
+    if args.json:
+        print(json.dumps({'baseline': baseline_meta, 'candidate': candidate_meta, 'environment_differences':
+                          differences, 'unmatched': [list(key) for key in only_in_one], 'results': rows}, indent=2))
+    else:
+        print(f"baseline:  {baseline_meta.get('git_commit')} ({baseline_meta.get('timestamp')})")
+        print(f"candidate: {candidate_meta.get('git_commit')} ({candidate_meta.get('timestamp')})")
+        if differences:
+            print(f"warning: the runs differ in {', '.join(differences)}")
+        print(f"{'suite':<11}{'case':<24}{'size':>9}  {'metric':<13}{'baseline':>13}{'candidate':>13}{'change':>9}  "
+              f"status")
+        for r in rows:
+            print(f"{r['suite']:<11}{r['case']:<24}{r['size']:>9}  {r['metric']:<13}{r['baseline']:>13.2f}"
+                  f"{r['candidate']:>13.2f}{r['change']:>+9.1%}  {r['status']}")
+        if only_in_one:
+            print(f"{len(only_in_one)} metrics were measured in only one of the runs")
+    raise SystemExit(1 if any(r['status'] == 'regression' for r in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
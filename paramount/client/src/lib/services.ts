@@ -1,9 +1,40 @@
-import { ILatestDataResult, IRecord, TResult } from '@/lib/types.ts'
+import { ILatestDataResult, IRecord, IRecordUpdate, TResult } from '@/lib/types.ts'
 
 // Uncomment this if will deploy the client and the server
 // separately and add this prefix to the endpoints
 // const API_URL = import.meta.env.VITE_API_ENDPOINT
 
+// Last response per endpoint + request body, revalidated with If-None-Match: a 304 reuses it
+const conditionalCache = new Map<string, { etag: string; body: any }>()
+const CONDITIONAL_CACHE_SIZE = 50
+
+async function postConditional(url: string, payload: object): Promise<{ ok: boolean; body: any }> {
+  const requestBody = JSON.stringify(payload)
+  const cacheKey = `${url} ${requestBody}`
+  const cached = conditionalCache.get(cacheKey)
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(cached ? { 'If-None-Match': cached.etag } : {}),
+    },
+    body: requestBody,
+  })
+
+  if (response.status === 304 && cached) return { ok: true, body: cached.body }
+  if (!response.ok) return { ok: false, body: null }
+  const body = await response.json()
+  const etag = response.headers.get('ETag')
+  if (etag) {
+    conditionalCache.delete(cacheKey)
+    conditionalCache.set(cacheKey, { etag, body })
+    if (conditionalCache.size > CONDITIONAL_CACHE_SIZE) {
+      conditionalCache.delete(conditionalCache.keys().next().value as string)
+    }
+  }
+  return { ok: true, body }
+}
+
 export default class Services {
   static async GetConfig(): Promise<TResult<Record<string, string[]>, Error>> {
     const response = await fetch(`/api/config`, {
@@ -29,20 +60,14 @@ export default class Services {
     recordingIds: string[],
     evaluatedRowsOnly?: boolean
   ): Promise<TResult<ILatestDataResult, Error>> {
-    const response = await fetch(`/api/latest`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        identifier_value: identifier,
-        recording_ids: recordingIds || [],
-        evaluated_rows_only: evaluatedRowsOnly,
-      }),
+    const response = await postConditional(`/api/latest`, {
+      identifier_value: identifier,
+      recording_ids: recordingIds || [],
+      evaluated_rows_only: evaluatedRowsOnly,
     })
 
     if (response.ok) {
-      const res = await response.json()
+      const res = response.body
       console.log('Latest Data: ', res)
       // To protect against someone pasting a random UUID and seeing internal datastructures
       if (res.result.length === 0) return { error: new Error('No data found'), data: null }
@@ -56,7 +81,7 @@ export default class Services {
   }
 
   static async SaveSession(
-    updatedRecords: IRecord[],
+    updates: IRecordUpdate[],
     sessionAccuracy: number, // It's float on server side, should be between 0 & 1
     sessionName: string,
     recordedIds: string[],
@@ -68,7 +93,7 @@ export default class Services {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({
-        updated_records: updatedRecords,
+        updates,
         session_accuracy: sessionAccuracy,
         session_name: sessionName,
         recorded_ids: recordedIds,
@@ -91,18 +116,12 @@ export default class Services {
   static async GetSessions(
     identifierValue: string
   ): Promise<TResult<any[], Error>> {
-    const response = await fetch(`/api/get_sessions`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        identifier_value: identifierValue,
-      }),
+    const response = await postConditional(`/api/get_sessions`, {
+      identifier_value: identifierValue,
     })
 
     if (response.ok) {
-      const res = await response.json()
+      const res = response.body
       console.log('GET SESSIONS', res)
       return {
         data: res,
@@ -67,6 +67,12 @@ export interface IRecord extends IParamountRecordFields {
   cosine_similarity?: number
 }
 
+// Only the fields of a record that were changed in the UI
+export interface IRecordUpdate {
+  recording_id: string
+  fields: Record<string, any>
+}
+
 export interface IParamountSession {
   paramount__session_accuracy: number
   paramount__session_id: string
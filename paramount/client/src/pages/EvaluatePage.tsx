@@ -5,7 +5,7 @@ import DownloadIcon from '@/components/Icons/DownloadIcon'
 import { AppContext } from '@/context'
 import SaveIcon from '@/components/Icons/SaveIcon'
 import { getParamsForExport } from '@/lib/utils'
-import { IRecord, TParamountEvaluate } from '@/lib/types'
+import { IRecord, IRecordUpdate, TParamountEvaluate } from '@/lib/types'
 import Services from '@/lib/services'
 import PageSkeleton from '@/components/PageSkeleton'
 import { ACCURATE_EVALUTATION, INACCURATE_EVALUTATION } from '@/lib/constants'
@@ -30,9 +30,10 @@ export default function EvaluatePage() {
 
   const gridRef = useRef<AgGridReact>(null)
   const [searchKey, setSearchKey] = useState<string>('')
-  const [updatedRecords, setUpdatedRecords] = useState<Record<string, IRecord>>(
-    {}
-  )
+  // Changed fields per recording id: only these are sent when saving
+  const [updatedFields, setUpdatedFields] = useState<
+    Record<string, Record<string, any>>
+  >({})
   const [reviewIndex, setReviewIndex] = useState(0)
   const [changeHappened, setChangeHappened] = useState(false)
   const [saving, setSaving] = useState(false)
@@ -50,10 +51,14 @@ export default function EvaluatePage() {
         d.paramount__recording_id === event.data.paramount__recording_id
     )
 
-    if (foundRecord) {
-      setUpdatedRecords((prevRecords) => ({
-        ...prevRecords,
-        [foundRecord.paramount__recording_id]: foundRecord,
+    const field = event.colDef.field
+    if (foundRecord && field) {
+      setUpdatedFields((prevFields) => ({
+        ...prevFields,
+        [foundRecord.paramount__recording_id]: {
+          ...prevFields[foundRecord.paramount__recording_id],
+          [field]: event.newValue,
+        },
       }))
     }
 
@@ -71,9 +76,12 @@ export default function EvaluatePage() {
     reviewedObject.paramount__evaluation = paramountEvaluation
 
     setReviewIndex((prevState) => prevState + 1)
-    setUpdatedRecords((prevRecords) => ({
-      ...prevRecords,
-      [reviewedObject.paramount__recording_id]: reviewedObject,
+    setUpdatedFields((prevFields) => ({
+      ...prevFields,
+      [reviewedObject.paramount__recording_id]: {
+        ...prevFields[reviewedObject.paramount__recording_id],
+        paramount__evaluation: paramountEvaluation,
+      },
     }))
 
     setChangeHappened(true)
@@ -88,12 +96,14 @@ export default function EvaluatePage() {
 
   const onSaveSession = async () => {
     setSaving(true)
-    const records = Object.values(updatedRecords)
+    const updates: IRecordUpdate[] = Object.entries(updatedFields).map(
+      ([recordingId, fields]) => ({ recording_id: recordingId, fields })
+    )
     const sessionAccuracy = accuracy / 100
     const sessionName = Date.now().toString()
     const recordedIds = evaluateData.map((d) => d.paramount__recording_id)
     const { error } = await Services.SaveSession(
-      records,
+      updates,
       sessionAccuracy,
       sessionName,
       recordedIds,
@@ -101,6 +111,8 @@ export default function EvaluatePage() {
     )
     if (error) {
       console.log('save session error: ', error)
+    } else {
+      setUpdatedFields({}) // Saved: the next save only sends what changes from here on
     }
     setChangeHappened(false)
     setSaving(false)
@@ -1,14 +1,19 @@
+import functools
 import pandas as pd
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, make_response, request, jsonify, send_from_directory
 from paramount.server.db_connector import db
 import traceback
-import requests
 import uuid
 import pytz
-import threading
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from paramount.server.library_functions import get_result_from_colname, load_config
+from paramount.server.similarity import compute_similarity, DEFAULT_CHUNK_SIZE
+from paramount.server.replay import get_session, invoke
+from paramount.server.replay_cache import cache_key, replay_cache_from_config
+from paramount.server.read_cache import read_cache_from_config
+from paramount.server.indexes import ensure_indexes_in_background, manage_indexes_enabled, paramount_indexes
+from paramount.server.encoding import arrow_ipc, clean_none_strings, columns_json, compress_response
+from paramount.server.writer import get_writer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from paramount.server.library_functions import get_result_from_colname, load_config, encode_cursor, decode_cursor
 from datetime import datetime
 
 
@@ -20,20 +25,43 @@ paramount_identifier_colname = config['api']['identifier_colname']
 base_url = config['record']['function_url']
 db_type = config['db']['type']
 split_by_id = config['api']['split_by_id']
+similarity_metric = config['api'].get('similarity_metric', 'tfidf_cosine')
+default_page_size = int(config['api'].get('page_size', 100))
+max_page_size = int(config['api'].get('max_page_size', 1000))
+replay_concurrency = int(config['api'].get('replay_concurrency', 16))
+replay_connect_timeout = float(config['api'].get('replay_connect_timeout', 5))
+replay_timeout = float(config['api'].get('replay_timeout', 300))  # Read timeout: LLM functions can take a while
+replay_mode = config['api'].get('replay_mode', 'auto')  # auto: in-process when the function is registered here
+compression = config['api'].get('compression', True)  # brotli (when installed) or gzip, as the client accepts
+compression_min_size = int(config['api'].get('compression_min_size', 1024))
 
 connection_string = ""
-if db_type in config['db']:
-    db_config = config['db'].get(db_type)
-    if db_config and 'connection_string' in db_config:
-        connection_string = db_config['connection_string']
+db_config = config['db'].get(db_type) or {}  # Backend specific settings, eg. [db.postgres]
+if 'connection_string' in db_config:
+    connection_string = db_config['connection_string']
 
-db_instance = db.get_database(db_type, connection_string)
+db_instance = db.get_database(db_type, connection_string, db_config)
+# Sessions are written (and spooled) like recordings, by the same writer as record() in this process
+writer = get_writer(db_instance, config['record'], database=(db_type, connection_string))
+if manage_indexes_enabled(config):
+    ensure_indexes_in_background(db_instance, paramount_indexes(config))
+
+replay_cache_config = config['api'].get('replay_cache', {})
+replay_cache = replay_cache_from_config(replay_cache_config, db_instance)
+replay_cache_version = str(replay_cache_config.get('version', ''))  # Bump when the replayed code changes
+
+read_cache = read_cache_from_config(config['api'].get('read_cache', {}))
+if read_cache is not None:
+    writer.write_listeners.append(read_cache.invalidate)  # Recordings and sessions written by this process
 
 print(f"paramount_identifier_colname: {paramount_identifier_colname}")
 print(f"Function replay base_url: {base_url}")
 print(f"DB connection string length: {len(connection_string)} characters")  # Don't print the actual str: security risk
 print(f"db type: {db_type}")
 print(f"split by id: {split_by_id}")
+print(f"replay mode: {replay_mode}")
+print(f"replay cache: {'enabled' if replay_cache else 'disabled'}")
+print(f"read cache: {'enabled' if read_cache else 'disabled'}")
 
 
 def err_dict(err_type, err_tcb):
@@ -42,7 +70,14 @@ def err_dict(err_type, err_tcb):
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "OK", "time": datetime.now()}), 200
+    status = {"status": "OK", "time": datetime.now()}
+    pool_status = db_instance.pool_status()
+    if pool_status is not None:  # Checkout counts and times, to size pool_size / max_overflow against the workers
+        status["db_pool"] = pool_status
+    status["writer"] = writer.stats()  # Includes the spool's depth and oldest_age_seconds, when spooling
+    if read_cache is not None:
+        status["read_cache"] = read_cache.stats()
+    return jsonify(status), 200
 
 
 # Entry route for the client
@@ -61,8 +96,11 @@ def static_file(path):
 def after_request(response):
     header = response.headers
     header['Access-Control-Allow-Origin'] = '*'
-    header['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    header['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, If-None-Match'
     header['Access-Control-Allow-Methods'] = 'OPTIONS, HEAD, GET, POST, DELETE, PUT'
+    header['Access-Control-Expose-Headers'] = 'X-Paramount-Next-Cursor, ETag'
+    if compression:
+        response = compress_response(response, request.accept_encodings, compression_min_size)
     return response
 
 
@@ -76,6 +114,61 @@ def get_client_config():
         return jsonify(err_obj), 500
 
 
+def parse_timestamp(value):
+    """ISO 8601 string from a request to a tz-aware datetime (naive ones are taken as UTC), None stays None."""
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=pytz.UTC)
+
+
+def columnar_response(df, fmt, **fields):
+    """
+    df as format 'columns' (see columns_json) or 'arrow' (an Arrow IPC stream, with the other fields in
+    X-Paramount-* headers). The default 'records' format is built by each endpoint, as its shape predates these.
+    """
+    if fmt == 'columns':
+        return Response(columns_json(df, **fields), mimetype='application/json')
+    if fmt == 'arrow':
+        response = Response(arrow_ipc(df), mimetype='application/vnd.apache.arrow.stream')
+        for key, value in fields.items():
+            if value is not None:
+                response.headers['X-Paramount-' + key.replace('_', '-').title()] = str(value)
+        return response
+    raise ValueError(f"Unsupported format: {fmt} (should be one of records, columns, arrow)")
+
+
+def cached_read(table_name):
+    """
+    Serve a read endpoint from the read cache, keyed by the request's JSON arguments, and answer requests whose
+    If-None-Match holds the ETag of the current response with a bodiless 304.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            if read_cache is None:
+                return view()
+            key = read_cache.key(request.path, request.get_json(silent=True))
+            entry = read_cache.get(key)
+            if entry is None:
+                generation = read_cache.generation(table_name)
+                response = make_response(view())
+                if response.status_code != 200:
+                    return response
+                headers = {k: v for k, v in response.headers.items() if k.startswith('X-Paramount-')}
+                entry = read_cache.set(key, table_name, generation, response.get_data(), response.mimetype, headers)
+
+            # Weak: the same page may go out brotli, gzip or uncompressed (see after_request)
+            if request.if_none_match.contains_weak(entry.etag):
+                response = Response(status=304)
+            else:
+                response = Response(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+            response.set_etag(entry.etag, weak=True)
+            return response
+        return wrapper
+    return decorator
+
+
 def check_id_splitter(data):
     if split_by_id:
         if 'identifier_value' in data:
@@ -90,6 +183,7 @@ def check_id_splitter(data):
 
 
 @app.route('/api/latest', methods=['POST'])
+@cached_read('paramount_data')
 def latest():
     data = request.get_json()
     try:
@@ -99,7 +193,16 @@ def latest():
 
         evaluated_rows_only = bool(data.get('evaluated_rows_only', False))
         recording_ids = list(data.get('recording_ids', []))
-        response_data = {"result": None, "column_order": []}
+        response_format = data.get('format', 'records')  # Or 'columns' / 'arrow', see columnar_response()
+        response_data = {"result": None, "column_order": [], "next_cursor": None}
+        read_df = pd.DataFrame()
+
+        # Keyset pagination: pass back the next_cursor of a response to get the page after it
+        page_size = min(int(data.get('page_size') or default_page_size), max_page_size)
+        cursor = decode_cursor(data['cursor']) if data.get('cursor') else None
+        start_time = parse_timestamp(data.get('start_time'))
+        end_time = parse_timestamp(data.get('end_time'))
+        function_name = data.get('function_name')
 
         # TODO: Only get non-error rows. Possible by passing "output cols that are supposed to be non-null" to read_df
         # eg. PARAMOUNT_OUTPUT_COLS env var, to get_recordings() fct: can tell _and() clause that cols must be non-null
@@ -108,14 +211,23 @@ def latest():
                                                  split_by_id=split_by_id,
                                                  identifier_value=identifier_value,
                                                  identifier_column_name=determined_id_colname,
-                                                 recording_ids=recording_ids)
-            # Convert the DataFrame into a dictionary with records orientation to properly format it for JSON
+                                                 recording_ids=recording_ids, page_size=page_size, cursor=cursor,
+                                                 start_time=start_time, end_time=end_time,
+                                                 function_name=function_name)
             # Doing None Cleaning: Otherwise None becomes 'None' and UUID upsert fails (UUID col does not accept 'None')
             # TODO: Ideally, need for cleaning would be prevented upstream, so that 'None' never happens to begin with..
-            data_dict = [{k: None if v is None or v == "None" else v for k, v in record.items()}
-                         for record in read_df.to_dict(orient='records')]
-            response_data["result"] = data_dict
-            response_data["column_order"] = read_df.columns.tolist()
+            read_df = clean_none_strings(read_df)
+            if len(read_df) == page_size:  # A full page: there may be more
+                last_row = read_df.iloc[-1]
+                response_data["next_cursor"] = encode_cursor(last_row['paramount__recorded_at'],
+                                                             last_row['paramount__recording_id'])
+            if response_format == 'records':
+                # Convert the DataFrame into a dictionary with records orientation to properly format it for JSON
+                response_data["result"] = read_df.to_dict(orient='records')
+                response_data["column_order"] = read_df.columns.tolist()
+
+        if response_format != 'records':
+            return columnar_response(read_df, response_format, next_cursor=response_data["next_cursor"]), 200
     except Exception as e:
         err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
         print(err_obj)
@@ -130,12 +242,18 @@ def submit_evaluations():
     try:
         # Save updated recordings
         ground_truth_table_name = 'paramount_data'
-        updated_records = list(data['updated_records'])
-        merged = pd.DataFrame(updated_records)
         # TODO: Protect this endpoint with token or other mechanism (similar to company_uuid for /latest endpoint)
         # Currently not done as this db action only succeeds if there is a valid reference to paramount__recording_id
         # Which a potential attacker normally wouldn't have access to
-        db_instance.update_ground_truth(merged, ground_truth_table_name)
+        if 'updates' in data:  # Deltas: [{"recording_id": ..., "fields": {column: new value}}]
+            updates = {str(update['recording_id']): dict(update['fields']) for update in data['updates']}
+            updated_count = db_instance.update_fields(ground_truth_table_name, updates)
+            print(f"Updated {updated_count} of {len(updates)} recordings")
+        else:  # Clients that send the whole records
+            merged = pd.DataFrame(list(data['updated_records']))
+            db_instance.update_ground_truth(merged, ground_truth_table_name)
+        if read_cache is not None:
+            read_cache.invalidate(ground_truth_table_name)
 
         # Save new session
         sessions_table_name = 'paramount_sessions'
@@ -157,12 +275,12 @@ def submit_evaluations():
             'paramount__session_name': session_name,
             'paramount__session_splitter_id': id_splitter
         }
-        df = pd.DataFrame([session_data])
         ts_col = 'paramount__session_timestamp'
-        df[ts_col] = pd.to_datetime(df[ts_col])  # To ensure correct dtype: timestamptz, upon table creation
-        # Fire and forget for this heavy operation
-        threading.Thread(target=db_instance.create_or_append,
-                         args=(df, sessions_table_name, 'paramount__session_id'), daemon=True).start()
+        # To ensure correct dtype: timestamptz, upon table creation
+        session_data[ts_col] = pd.Timestamp(session_data[ts_col])
+        # Off the request path, and retried by the spool when the database is unavailable
+        if not writer.submit(session_data, sessions_table_name, 'paramount__session_id'):
+            raise RuntimeError('The recording queue is full: session not saved')
         print(f"Saving session {session_id} with acc: {round(100*session_accuracy,1)}%, and splitter id: {id_splitter}")
     except Exception as e:
         err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
@@ -173,6 +291,7 @@ def submit_evaluations():
 
 
 @app.route('/api/get_sessions', methods=['POST'])
+@cached_read('paramount_sessions')
 def get_sessions():
     data = request.get_json()
     try:
@@ -181,6 +300,9 @@ def get_sessions():
         all_sessions = db_instance.get_sessions(sessions_table_name, split_by_id=split_by_id,
                                                 identifier_value=identifier_value,
                                                 identifier_column_name='paramount__session_splitter_id')
+        response_format = data.get('format', 'records')  # Or 'columns' / 'arrow', see columnar_response()
+        if response_format != 'records':
+            return columnar_response(all_sessions, response_format), 200
     except Exception as e:
         err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
         print(err_obj)
@@ -196,87 +318,105 @@ def infer():
     try:
         row = dict(data['record'])
         session_output_cols = list(data['output_cols'])
+        result, cache_status = replay_record(row, session_output_cols, cache_version=data.get('cache_version'),
+                                             use_cache=bool(data.get('use_cache', True)))
+    except Exception as e:
+        err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
+        print(err_obj)
+        return jsonify(err_obj), 500
 
-        args = get_values_dict('input_args__', row)
-        kwargs = get_values_dict('input_kwargs__', row)
-
-        print("\n\n", 'args', args, 'kwargs', kwargs, 'baseurl', base_url, 'row', row['paramount__function_name'], "\n\n")
-
-        result = invoke_via_functions_api(base_url=base_url, func_name=row['paramount__function_name'],
-                                          args=args, kwargs=kwargs)
+    return jsonify({"result": result, "cache": cache_status}), 200
 
-        for output_col in session_output_cols:
-            output_index, _, data_item = get_result_from_colname(result, output_col)
-            testcol = 'test_' + output_col
-            result[output_index][testcol] = str(data_item)
 
+@app.route('/api/infer_batch', methods=['POST'])
+def infer_batch():
+    """
+    Replay many records concurrently, at most [api] replay_concurrency at a time. Results are streamed back as
+    NDJSON, one line per record in completion order: {"index", "recording_id", "result", "cache"} or
+    {"index", "recording_id", "error"}.
+    """
+    data = request.get_json()
+    try:
+        rows = [dict(row) for row in data['records']]
+        session_output_cols = list(data['output_cols'])
+        concurrency = max(1, min(int(data.get('concurrency', replay_concurrency)), replay_concurrency))
+        cache_version = data.get('cache_version')
+        use_cache = bool(data.get('use_cache', True))
     except Exception as e:
         err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
         print(err_obj)
         return jsonify(err_obj), 500
 
-    return jsonify({"result": result}), 200
+    def generate():
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='paramount-replay')
+        try:
+            futures = {executor.submit(replay_record, row, session_output_cols, cache_version, use_cache): index
+                       for index, row in enumerate(rows)}
+            for future in as_completed(futures):
+                index = futures[future]
+                line = {"index": index, "recording_id": rows[index].get('paramount__recording_id')}
+                try:
+                    line["result"], line["cache"] = future.result()
+                except Exception as e:
+                    line["error"] = err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())
+                yield app.json.dumps(line) + "\n"
+        finally:  # Also reached when the client disconnects: don't start replays nobody is waiting for
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+def replay_record(row, session_output_cols, cache_version=None, use_cache=True):
+    """
+    Re-run the recorded function of one row and add its new outputs as test_<output col> entries.
+    Returns (result, cache status), where the status tells whether the replay cache answered, and from which tier.
+    """
+    args = get_values_dict('input_args__', row)
+    kwargs = get_values_dict('input_kwargs__', row)
+    func_name = row['paramount__function_name']
+
+    result, cache_status, key = None, {"status": "disabled", "tier": None}, None
+    if replay_cache is not None and use_cache:
+        version = cache_version if cache_version is not None else replay_cache_version
+        key = cache_key(func_name, args, kwargs, version)
+        result, tier = replay_cache.get(key)
+        cache_status = {"status": "hit" if tier else "miss", "tier": tier}
+
+    if result is None:
+        result = invoke(base_url=base_url, func_name=func_name, args=args, kwargs=kwargs,
+                        mode=replay_mode, session=get_session(config['api']),
+                        timeout=(replay_connect_timeout, replay_timeout))
+        if key is not None and isinstance(result, (list, dict)):  # Only successful replays: errors aren't cached
+            replay_cache.set(key, func_name, result)  # Stored as JSON text: unaffected by the test_ entries below
+
+    for output_col in session_output_cols:
+        output_index, _, data_item = get_result_from_colname(result, output_col)
+        testcol = 'test_' + output_col
+        result[output_index][testcol] = str(data_item)
+    return result, cache_status
 
 
 @app.route('/api/similarity', methods=['POST'])
 def similarity():
     data = request.get_json()
     try:
-        vectorizer = TfidfVectorizer()
-
         selected_output_var = str(data['output_col_to_be_tested'])
+        metric = str(data.get('metric', similarity_metric))
         clean_test_set = pd.DataFrame(data['records'])
 
         # To ensure comparability
-        clean_test_set[selected_output_var] = clean_test_set[selected_output_var].astype(str)
-        clean_test_set['test_' + selected_output_var] = \
-            clean_test_set['test_' + selected_output_var].astype(str)
+        ground_truth = clean_test_set[selected_output_var].astype(str)
+        test_set = clean_test_set['test_' + selected_output_var].astype(str)
 
-        vectorizer.fit_transform(clean_test_set[selected_output_var])
-
-        # Transform both the ground truth and test set data (columns 1 and 2)
-        tfidf_matrix_ground_truth = vectorizer.transform(clean_test_set[selected_output_var])
-        tfidf_matrix_test_set = vectorizer.transform(clean_test_set['test_' + selected_output_var])
-
-        # Calculate cosine similarity between the corresponding rows in columns 1 and 2
-        cosine_similarities = [cosine_similarity(tfidf_matrix_ground_truth[i:i + 1],
-                                                 tfidf_matrix_test_set[i:i + 1])[0][0]
-                               for i in range(tfidf_matrix_ground_truth.shape[0])]
+        # Similarity between the corresponding rows of the ground truth and the test set, vectorized per chunk
+        similarities = compute_similarity(ground_truth, test_set, metric=metric,
+                                          chunk_size=config['api'].get('similarity_chunk_size', DEFAULT_CHUNK_SIZE))
     except Exception as e:
         err_obj = {"error": err_dict(f"{type(e).__name__}: {e}", traceback.format_exc())}
         print(err_obj)
         return jsonify(err_obj), 500
 
-    return jsonify({"result": cosine_similarities}), 200
-
-
-def invoke_via_functions_api(func_name, base_url, args=None, kwargs=None):
-    # construct the endpoint based on the function name
-    endpoint = f'{base_url}/paramount_functions/{func_name}'
-    data_payload = {}
-    if args is not None:
-        data_payload['args'] = args
-    if kwargs is not None:
-        data_payload['kwargs'] = kwargs
-    try:
-        # Send the POST request to the endpoint with JSON payload
-        response = requests.post(endpoint, json=data_payload)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Handle successful response
-            response = response.json()
-        else:
-            # Handle errors
-            err = (response.status_code, response.text)
-            print("Error:", err)
-            response = err
-    except requests.exceptions.RequestException as e:
-        # Handle request exceptions (e.g., connection errors)
-        print("Request failed:", e)
-        response = e
-
-    return response
+    return jsonify({"result": similarities}), 200
 
 
 def get_values_dict(col_prefix, row_dict):
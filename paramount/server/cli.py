@@ -1,8 +1,11 @@
+import argparse
+import importlib.util
 import subprocess
 import webbrowser
 import threading
 import time
 from paramount.server.library_functions import load_config
+from paramount.server.indexes import ensure_indexes, paramount_indexes
 
 config = load_config()
 endpoint = config['api']['endpoint']
@@ -11,22 +14,101 @@ url = f"{endpoint}:{port}"
 print(f"Running on url: {url}")
 
 
-def start_gunicorn():
+WORKER_CLASSES = ('gthread', 'gevent')
+
+
+def start_gunicorn(args):
     gunicorn_command = [
         "gunicorn",
         "--bind", f":{port}",
-        "--workers", "1",
-        "--threads", "8",
-        "--timeout", "0",
-        "paramount.server.wsgi:app"
+        "--workers", str(args.workers),
+        "--timeout", str(args.timeout),
+        "--config", "python:paramount.server.gunicorn_conf",
     ]
-    subprocess.run(gunicorn_command)
+    if args.worker_class == 'gevent':
+        # One greenlet per request: replays waiting on LLM functions don't hold a thread that /api/latest needs
+        gunicorn_command += ["--worker-class", "gevent", "--worker-connections", str(args.worker_connections)]
+    else:
+        gunicorn_command += ["--threads", str(args.threads)]
+    subprocess.run(gunicorn_command + ["paramount.server.wsgi:app"])
+
+
+def report_indexes(create=False):
+    from paramount.server.db_connector import db  # Only needed by this subcommand
+
+    db_type = config['db']['type']
+    db_config = config['db'].get(db_type) or {}
+    db_instance = db.get_database(db_type, db_config.get('connection_string', ""), db_config)
+    indexes = paramount_indexes(config)
+    if create:
+        ensure_indexes(db_instance, indexes)
+
+    health = [entry for table_name, table_indexes in indexes.items()
+              for entry in db_instance.get_index_health(table_name, table_indexes)]
+    if not health:
+        print(f"No indexes to report for db type: {db_type}")
+        return 0
+    print(f"{'table':<20} {'index':<42} {'status':<9} {'managed':<8} {'size':>10} {'scans':>10}")
+    for entry in health:
+        print(f"{entry['table']:<20} {entry['name']:<42} {entry['status']:<9} {str(entry['managed']):<8} "
+              f"{entry['size_bytes']:>10} {entry['scans']:>10}")
+    problems = [entry for entry in health if entry['managed'] and entry['status'] in ('missing', 'invalid')]
+    for entry in problems:
+        print(f"{entry['name']} is {entry['status']}: {entry['definition']}")
+    if problems and not create:
+        print("Run `paramount indexes --create` to build the missing or invalid indexes")
+    return 1 if problems else 0
+
+
+def report_spool(max_age=None):
+    from paramount.server.spool import inspect_spool  # Only needed by this subcommand
+
+    directory = config['record'].get('spool', {}).get('directory', 'paramount_spool')
+    report = inspect_spool(directory)
+    if not report:
+        print(f"No spool in {directory}")
+        return 0
+    print(f"{'directory':<32} {'batches':>8} {'rows':>10} {'bytes':>12} {'oldest (s)':>11} {'failed bytes':>13}")
+    for entry in report:
+        print(f"{entry['directory']:<32} {entry['pending_batches']:>8} {entry['pending_rows']:>10} "
+              f"{entry['pending_bytes']:>12} {entry['oldest_age_seconds']:>11.1f} {entry['failed_bytes']:>13}")
+    too_old = max_age is not None and any(entry['oldest_age_seconds'] > max_age for entry in report)
+    if too_old:
+        print(f"Spooled recordings older than {max_age}s: is the database reachable?")
+    return 1 if too_old else 0
 
 
 def main():
+    server_config = config.get('server', {})
+    parser = argparse.ArgumentParser(prog='paramount')
+    parser.add_argument('--workers', type=int, default=server_config.get('workers', 1),
+                        help='gunicorn worker processes')
+    parser.add_argument('--worker-class', choices=WORKER_CLASSES, default=server_config.get('worker_class', 'gthread'),
+                        help='gthread: a thread per request, gevent: non-blocking, needs pip install paramount[async]')
+    parser.add_argument('--threads', type=int, default=server_config.get('threads', 8),
+                        help='threads per worker (gthread)')
+    parser.add_argument('--worker-connections', type=int, default=server_config.get('worker_connections', 1000),
+                        help='concurrent requests per worker (gevent)')
+    parser.add_argument('--timeout', type=int, default=server_config.get('timeout', 0),
+                        help='seconds before a silent worker is restarted, 0 to disable')
+    subparsers = parser.add_subparsers(dest='command')
+    indexes_parser = subparsers.add_parser('indexes', help='report the health of the indexes on paramount tables')
+    indexes_parser.add_argument('--create', action='store_true', help='build missing or invalid indexes first')
+    spool_parser = subparsers.add_parser('spool', help='report the recordings waiting in the local spool')
+    spool_parser.add_argument('--max-age', type=float, help='exit with status 1 if a spooled batch is older (seconds)')
+    args = parser.parse_args()
+    if args.command == 'indexes':
+        raise SystemExit(report_indexes(create=args.create))
+    if args.command == 'spool':
+        raise SystemExit(report_spool(max_age=args.max_age))
+
+    if args.worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+        print("The gevent worker class needs gevent: pip install paramount[async]")
+        raise SystemExit(1)
+
     # Start gunicorn server in a separate thread
-    print("Starting gunicorn server...")
-    gunicorn_thread = threading.Thread(target=start_gunicorn)
+    print(f"Starting gunicorn server ({args.workers} {args.worker_class} workers)...")
+    gunicorn_thread = threading.Thread(target=start_gunicorn, args=(args,))
     gunicorn_thread.start()
 
     # Wait for a moment to ensure the server starts
@@ -1,29 +1,381 @@
 # CSV implementation
 from .db import Database
+import io
 import os
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 
+try:
+    import fcntl
+except ImportError:  # Windows: the locks below only serialize the threads of this process
+    fcntl = None
+
+PK = 'paramount__recording_id'
+RECORDED_AT = 'paramount__recorded_at'
+
+# Sidecar index (<table>.csv.idx): a header, then one fixed size entry per CSV row, in file order
+INDEX_MAGIC = b'PMCSVIX1'
+INDEX_HEADER = struct.Struct('<8sQQ')  # Magic, inode of the CSV file it indexes, byte length of the CSV header line
+INDEX_ENTRY = np.dtype([('offset', '<i8'), ('length', '<i8'), ('recorded_at', '<i8'), ('recording_id', 'S36')])
+NAT = np.iinfo(np.int64).min  # recorded_at (ns since the epoch) of rows without one
+MAX_SCAN_BATCH = 10000  # Rows parsed at a time while filling a page of filtered recordings
+
+
+def record_spans(lines, start):
+    """
+    (offset, length) of each CSV record in lines (bytes, newline terminated, as iterating a binary file gives them),
+    the first one at byte offset start. Quoted fields may span lines: a record ends on a line that leaves an even number
+    of quotes, as "" escapes keep the count even. Blank lines are skipped, like pandas does.
+    """
+    offset, length, quotes = start, 0, 0
+    for line in lines:
+        length += len(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            if length > len(line) or line.strip():
+                yield offset, length
+            offset, length, quotes = offset + length, 0, 0
+    if length:  # No newline at the end of the file
+        yield offset, length
+
+
+def index_entries(spans, values):
+    """Index entries of the rows at spans, values holding their recorded_at / recording id (when the table has them)."""
+    if len(spans) != len(values):
+        raise ValueError(f"Found {len(spans)} CSV records for {len(values)} rows: cannot index them")
+    entries = np.zeros(len(spans), dtype=INDEX_ENTRY)
+    if not len(spans):
+        return entries
+    spans = np.array(spans, dtype='<i8')
+    entries['offset'], entries['length'] = spans[:, 0], spans[:, 1]
+    entries['recorded_at'] = NAT
+    if RECORDED_AT in values:
+        recorded_at = pd.to_datetime(values[RECORDED_AT], utc=True, format='ISO8601', errors='coerce')
+        entries['recorded_at'] = recorded_at.values.astype('datetime64[ns]').view('<i8')
+    if PK in values:
+        entries['recording_id'] = [str(value).encode('utf-8') for value in values[PK].fillna('')]
+    return entries
+
+
+def timestamp_ns(value):
+    timestamp = pd.Timestamp(value)
+    return (timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp).value
+
+
+def split_newest(entries, count):
+    """The count newest entries, newest first (recording id descending on recorded_at ties), and all the others."""
+    batch, rest = entries, entries[:0]
+    if len(entries) > count:
+        threshold = np.partition(entries['recorded_at'], len(entries) - count)[len(entries) - count]
+        is_newer = entries['recorded_at'] >= threshold
+        batch, rest = entries[is_newer], entries[~is_newer]
+    batch = batch[np.lexsort((batch['recording_id'], batch['recorded_at']))[::-1]]
+    return batch[:count], np.concatenate([rest, batch[count:]])
+
 
 class CSVDatabase(Database):
+    """
+    One <table>.csv file per table. Next to it, <table>.csv.idx holds the byte offset, recorded_at and recording id of
+    every row, so pages of the newest rows, or rows by id, are read without parsing the whole file.
+
+    Writers hold an exclusive lock on <table>.csv.lock (a single appender, across threads and processes), readers a
+    shared one. Appends extend the index, rewrites (updates, new columns) replace both files. An index that lags behind
+    its CSV file (a crash between the two writes, rows appended by an older version) is caught up when next used.
+    """
+
+    def __init__(self):
+        self._write_lock = threading.Lock()  # Also serializes this process' writers where flock is not available
+        self._indexes = {}  # table_name -> (index inode, index size, index header, entries), as last read
+
+    @contextmanager
+    def locked(self, table_name, exclusive):
+        with open(table_name + '.csv.lock', 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            if exclusive:
+                with self._write_lock:
+                    yield
+            else:
+                yield
+        # Closing the lock file releases the flock
+
+    @contextmanager
+    def reading(self, table_name):
+        """Shared lock on the table, yielding its (CSV header line, index entries)."""
+        with self.locked(table_name, exclusive=False):
+            index = self.read_index(table_name)
+            if index is not None:
+                yield index
+                return
+        with self.locked(table_name, exclusive=True):  # The index needs to catch up first
+            yield self.sync_index(table_name)
+
+    def read_index(self, table_name):
+        """(CSV header line, index entries), or None when the index is missing or out of date."""
+        filename = table_name + '.csv'
+        try:
+            csv_stat = os.stat(filename)
+            index_stat = os.stat(filename + '.idx')
+        except FileNotFoundError:
+            self._indexes.pop(table_name, None)
+            return None
+
+        cached = self._indexes.get(table_name)
+        with open(filename + '.idx', 'rb') as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size or header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+                self._indexes.pop(table_name, None)
+                return None
+            entries = np.zeros(0, dtype=INDEX_ENTRY)
+            if cached is not None and cached[0] == index_stat.st_ino and cached[2] == header \
+                    and cached[1] <= index_stat.st_size:
+                entries = cached[3]
+            count = (index_stat.st_size - INDEX_HEADER.size) // INDEX_ENTRY.itemsize - len(entries)
+            if count:  # Only read what was appended since the last time
+                index_file.seek(INDEX_HEADER.size + len(entries) * INDEX_ENTRY.itemsize)
+                entries = np.concatenate([entries, np.fromfile(index_file, dtype=INDEX_ENTRY, count=count)])
+        self._indexes[table_name] = (index_stat.st_ino, index_stat.st_size, header, entries)
+
+        _, csv_inode, header_length = INDEX_HEADER.unpack(header)
+        indexed_end = int(entries['offset'][-1] + entries['length'][-1]) if len(entries) else header_length
+        if csv_inode != csv_stat.st_ino or indexed_end != csv_stat.st_size:
+            return None
+        with open(filename, 'rb') as csv_file:
+            return csv_file.read(header_length), entries
+
+    def sync_index(self, table_name):
+        """Bring the index up to date with the CSV file (exclusive lock held): returns (CSV header line, entries)."""
+        index = self.read_index(table_name)
+        if index is not None:
+            return index
+
+        filename = table_name + '.csv'
+        csv_inode = os.stat(filename).st_ino
+        cached = self._indexes.get(table_name)
+        if cached is not None:
+            _, indexed_inode, header_length = INDEX_HEADER.unpack(cached[2])
+            entries = cached[3]
+            indexed_end = int(entries['offset'][-1] + entries['length'][-1]) if len(entries) else header_length
+            if indexed_inode == csv_inode and indexed_end < os.path.getsize(filename):  # Rows appended after it
+                with open(filename, 'rb') as csv_file:
+                    header = csv_file.read(header_length)
+                    csv_file.seek(indexed_end)
+                    data = csv_file.read()
+                new_entries = index_entries(list(record_spans(io.BytesIO(data), indexed_end)),
+                                            self.index_values(header + data))
+                self.append_index(table_name, len(entries), new_entries)
+                return header, np.concatenate([entries, new_entries])
+
+        print(f"PARAMOUNT: Indexing {filename}")
+        with open(filename, 'rb') as csv_file:
+            spans = list(record_spans(csv_file, 0))
+            csv_file.seek(0)
+            header = csv_file.read(spans[0][1]) if spans else b''
+        entries = index_entries(spans[1:], self.index_values(filename))
+        self.write_index(table_name, csv_inode, len(header), entries)
+        return header, entries
+
+    @staticmethod
+    def index_values(source):
+        """The recorded_at / recording id columns of a CSV file (or its bytes), as far as the table has them."""
+        source = io.BytesIO(source) if isinstance(source, bytes) else source
+        return pd.read_csv(source, usecols=lambda col: col in (RECORDED_AT, PK), dtype=str)
+
+    def write_index(self, table_name, csv_inode, header_length, entries):
+        filename = table_name + '.csv.idx'
+        with open(filename + '.tmp', 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, csv_inode, header_length))
+            index_file.write(entries.tobytes())
+        os.replace(filename + '.tmp', filename)
+
+    def append_index(self, table_name, count, new_entries):
+        # Written after the count entries already indexed, overwriting what a crash mid-write may have left behind
+        with open(table_name + '.csv.idx', 'r+b') as index_file:
+            index_file.seek(INDEX_HEADER.size + count * INDEX_ENTRY.itemsize)
+            index_file.write(new_entries.tobytes())
+            index_file.truncate()
+
+    def read_rows(self, table_name, header, entries):
+        """The indexed rows, in the order of entries, parsed by pandas as if they were the whole file."""
+        chunks = [header]
+        with open(table_name + '.csv', 'rb') as csv_file:
+            for offset, length in zip(entries['offset'].tolist(), entries['length'].tolist()):
+                csv_file.seek(offset)
+                chunk = csv_file.read(length)
+                chunks.append(chunk if chunk.endswith(b'\n') else chunk + b'\n')
+        return pd.read_csv(io.BytesIO(b''.join(chunks)), dtype={PK: str})
+
+    def read_table(self, table_name):
+        return pd.read_csv(table_name + '.csv', dtype={PK: str})
+
+    def append(self, df, table_name):
+        """Append rows (exclusive lock held), in the file's column order. New columns make for a rewrite."""
+        if not self.table_exists(table_name):
+            self.rewrite(df, table_name)
+            return
+        header, entries = self.sync_index(table_name)
+        if PK in df.columns and len(entries):
+            # Rows already in the table are kept, eg. when the spool delivers a batch again after a crash
+            df = df[~np.isin(df[PK].astype(str).to_numpy().astype('S36'), entries['recording_id'])]
+            if df.empty:
+                return
+        columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+        if any(col not in columns for col in df.columns):
+            self.rewrite(pd.concat([self.read_table(table_name), df], ignore_index=True), table_name)
+            return
+
+        filename = table_name + '.csv'
+        indexed_end = int(entries['offset'][-1] + entries['length'][-1]) if len(entries) else len(header)
+        data = df.reindex(columns=columns).to_csv(index=False, header=False).encode('utf-8')
+        new_entries = index_entries(list(record_spans(io.BytesIO(data), indexed_end)),
+                                    df[[col for col in (RECORDED_AT, PK) if col in df.columns]])
+        with open(filename, 'ab') as csv_file:  # One write: rows never interleave with another process' rows
+            csv_file.write(data)
+        self.append_index(table_name, len(entries), new_entries)
+
+    def rewrite(self, df, table_name):
+        """Replace the table and its index (exclusive lock held)."""
+        # Written next to the file, then swapped in: a crash mid-write never leaves a truncated table behind
+        filename = table_name + '.csv'
+        data = df.to_csv(index=False).encode('utf-8')
+        with open(filename + '.tmp', 'wb') as csv_file:
+            csv_file.write(data)
+        spans = list(record_spans(io.BytesIO(data), 0))
+        entries = index_entries(spans[1:], df[[col for col in (RECORDED_AT, PK) if col in df.columns]])
+        self.write_index(table_name, os.stat(filename + '.tmp').st_ino, spans[0][1], entries)
+        os.replace(filename + '.tmp', filename)
+
     def create_or_append(self, df, table_name, primary_key=None):
-        # Check if the file exists, and if not, create it with header, else append without header
-        filename = table_name+'.csv'
-        if not os.path.isfile(filename):
-            df.to_csv(filename, mode='a', index=False)
-        else:
-            df.to_csv(filename, mode='a', index=False, header=False)
+        with self.locked(table_name, exclusive=True):
+            self.append(df, table_name)
 
     def table_exists(self, table_name):
         return os.path.isfile(table_name+'.csv')
 
     def update_ground_truth(self, df, table_name):
-        df.to_csv(table_name+'.csv', index=False)
+        # Patch the rows that were sent and keep all others: the UI only ever holds a page of the recordings
+        if df.empty:
+            return
+        with self.locked(table_name, exclusive=True):
+            if not self.table_exists(table_name):
+                self.rewrite(df, table_name)
+                return
+            existing = self.read_table(table_name)
+            records = df.astype({PK: str}).to_dict(orient='records')
+            self.patch(existing, {record[PK]: record for record in records})
+            new_rows = df[~df[PK].astype(str).isin(existing[PK])]
+            if not new_rows.empty:
+                existing = pd.concat([existing, new_rows.reindex(columns=existing.columns)], ignore_index=True)
+            self.rewrite(existing, table_name)
+
+    def update_fields(self, table_name, updates):
+        with self.locked(table_name, exclusive=True):
+            df = self.read_table(table_name)
+            updated = self.patch(df, updates)
+            self.rewrite(df, table_name)
+        return updated
+
+    @staticmethod
+    def patch(df, updates):
+        """Set the given fields of the rows of df in place, by recording id. Returns the number of rows found."""
+        position = {recording_id: i for i, recording_id in enumerate(df[PK])}
+        updated = 0
+        for recording_id, fields in updates.items():
+            i = position.get(str(recording_id))
+            if i is None:
+                continue
+            for col, value in fields.items():
+                if col == PK:
+                    continue
+                if col not in df.columns or df[col].dtype != object:
+                    df[col] = df[col].astype(object) if col in df.columns else None  # Cells may get lists or dicts
+                df.at[df.index[i], col] = value
+            updated += 1
+        return updated
 
     def get_recordings(self, table_name, evaluated_rows_only, split_by_id, identifier_column_name=None,
-                       identifier_value=None):
-        # TODO: Implement splitter/id logic. Skipped for now as CSV assumed to be localhost
-        return pd.read_csv(table_name+'.csv')
+                       identifier_value=None, recording_ids=None, page_size=100, cursor=None, start_time=None,
+                       end_time=None, function_name=None):
+        pages, found = [], 0
+        with self.reading(table_name) as (header, entries):
+            # Filters on the indexed columns first, without reading any rows
+            recorded_at = entries['recorded_at']
+            selected = np.ones(len(entries), dtype=bool)
+            if recording_ids:  # e.g., fetch only the rows by their recording ids
+                selected &= np.isin(entries['recording_id'], [str(i).encode('utf-8') for i in recording_ids])
+            if start_time is not None:
+                selected &= recorded_at >= timestamp_ns(start_time)
+            if end_time is not None:
+                selected &= recorded_at < timestamp_ns(end_time)
+            if cursor is not None:  # Keyset pagination: rows strictly after the last one of the previous page
+                cursor_recorded_at, cursor_recording_id = timestamp_ns(cursor[0]), str(cursor[1]).encode('utf-8')
+                selected &= (recorded_at < cursor_recorded_at) | ((recorded_at == cursor_recorded_at)
+                                                                  & (entries['recording_id'] < cursor_recording_id))
+            candidates = entries[selected]
+
+            # Then newest first, a batch of rows at a time, until the other filters leave a full page
+            filtered = evaluated_rows_only or split_by_id or function_name
+            batch_size = page_size
+            while len(candidates) and found < page_size:
+                batch, candidates = split_newest(candidates, batch_size)
+                df = self.read_rows(table_name, header, batch)
+                if filtered:
+                    keep = pd.Series(True, index=df.index)
+                    if evaluated_rows_only:
+                        keep &= df['paramount__evaluation'].notna() & (df['paramount__evaluation'] != '')
+                    if split_by_id:
+                        keep &= df[identifier_column_name].astype(str) == str(identifier_value)
+                    if function_name:
+                        keep &= df['paramount__function_name'] == function_name
+                    df = df[keep]
+                if not df.empty:
+                    pages.append(df)
+                    found += len(df)
+                batch_size = min(batch_size * 2, MAX_SCAN_BATCH)
+        if not pages:
+            return pd.read_csv(io.BytesIO(header), dtype={PK: str})
+        return pd.concat(pages, ignore_index=True).head(page_size)
 
     def get_sessions(self, table_name, split_by_id, identifier_column_name, identifier_value):
-        # TODO: Implement splitter/id logic. Skipped for now as CSV assumed to be localhost
-        return pd.read_csv(table_name+'.csv')
+        with self.locked(table_name, exclusive=False):
+            df = self.read_table(table_name)
+        if split_by_id:
+            df = df[df[identifier_column_name].astype(str) == str(identifier_value)]
+        if 'paramount__session_timestamp' in df.columns:
+            df = df.sort_values('paramount__session_timestamp', ascending=False,
+                                key=lambda timestamps: pd.to_datetime(timestamps, utc=True, format='ISO8601'))
+        return df
+
+    # The offset index is kept up to date by every write: there are no other indexes to manage
+    def ensure_indexes(self, table_name, indexes):
+        return []
+
+    def get_index_health(self, table_name, indexes):
+        return []
+
+    def get_cached_replay(self, table_name, cache_key):
+        if not self.table_exists(table_name):
+            return None
+        with self.locked(table_name, exclusive=False):
+            df = pd.read_csv(table_name+'.csv', dtype={'cache_key': str, 'result': str})
+        df = df[df['cache_key'] == cache_key]
+        df = df[df['expires_at'].isna() | (pd.to_datetime(df['expires_at'], utc=True) > pd.Timestamp.now(tz='UTC'))]
+        return None if df.empty else df['result'].iloc[-1]  # Appended last is the most recent
+
+    def set_cached_replay(self, table_name, cache_key, function_name, result_json, expires_at):
+        df = pd.DataFrame([{'cache_key': cache_key, 'function_name': function_name, 'result': result_json,
+                            'created_at': pd.Timestamp.now(tz='UTC'), 'expires_at': expires_at}])
+        self.create_or_append(df, table_name)
+
+    def prune_cached_replays(self, table_name, max_entries):
+        if not self.table_exists(table_name):
+            return
+        with self.locked(table_name, exclusive=True):
+            df = pd.read_csv(table_name+'.csv', dtype={'cache_key': str, 'result': str})
+            df = df.drop_duplicates('cache_key', keep='last')
+            df = df[df['expires_at'].isna()
+                    | (pd.to_datetime(df['expires_at'], utc=True) > pd.Timestamp.now(tz='UTC'))]
+            self.rewrite(df.tail(max_entries), table_name)
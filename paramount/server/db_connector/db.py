@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from importlib import import_module
 
 
 # Abstraction for Database with a generic method
@@ -15,26 +16,65 @@ class Database(ABC):
     def update_ground_truth(self, df, table_name):
         pass
 
+    # Sets only the given fields of existing rows: updates maps recording ids to {column: new value}
     @abstractmethod
-    def get_recordings(self, table_name, evaluated_rows_only, split_by_id, identifier_column_name, identifier_value):
+    def update_fields(self, table_name, updates):
+        pass
+
+    # Newest first, page_size rows at a time. cursor is the (recorded_at, recording_id) of the previous page's last row
+    @abstractmethod
+    def get_recordings(self, table_name, evaluated_rows_only, split_by_id, identifier_column_name, identifier_value,
+                       recording_ids=None, page_size=100, cursor=None, start_time=None, end_time=None,
+                       function_name=None):
         pass
 
     @abstractmethod
     def get_sessions(self, table_name, split_by_id, identifier_column_name, identifier_value):
         pass
 
+    # Index specs come from paramount.server.indexes. Returns the names of the indexes that were built
+    @abstractmethod
+    def ensure_indexes(self, table_name, indexes):
+        pass
+
+    # List of {table, name, managed, status, size_bytes, scans, definition} dicts
+    @abstractmethod
+    def get_index_health(self, table_name, indexes):
+        pass
+
+    # Persistent tier of the replay cache: results are JSON text, expires_at a tz-aware datetime or None (never)
+    @abstractmethod
+    def get_cached_replay(self, table_name, cache_key):
+        pass
+
+    @abstractmethod
+    def set_cached_replay(self, table_name, cache_key, function_name, result_json, expires_at):
+        pass
+
+    @abstractmethod
+    def prune_cached_replays(self, table_name, max_entries):
+        pass
+
+    # Connection pool usage for /health, None for backends without a pool
+    def pool_status(self):
+        return None
+
+
+# Backend modules (of this package) and classes: only the selected one is imported, as the Postgres backend pulls in
+# SQLAlchemy and psycopg2, and all of them pandas
+DATABASES = {'csv': ('csv', 'CSVDatabase'), 'postgres': ('postgres', 'PostgresDatabase'),
+             'sqlite': ('sqlite', 'SQLiteDatabase')}
+
 
 # Factory method to instantiate the concrete class
-def get_database(database_type, connection_string=None):
+def get_database(database_type, connection_string=None, options=None):
+    if database_type not in DATABASES:
+        raise ValueError(f"Unsupported db: {database_type} (should be one of {DATABASES.keys()})")
     # Must do lazy imports here inside the function to avoid circular dependency errors
-    from .csv import CSVDatabase
-    from .postgres import PostgresDatabase
-    dbdict = {'csv': CSVDatabase, 'postgres': PostgresDatabase}
-    if database_type in dbdict:
-        print(f"Using database type: {database_type}, for paramount ground truth recordings")
-        if database_type == 'postgres':
-            return dbdict[database_type](connection_string)
-        else:
-            return dbdict[database_type]()
+    module_name, class_name = DATABASES[database_type]
+    database_class = getattr(import_module(f'.{module_name}', __package__), class_name)
+    print(f"Using database type: {database_type}, for paramount ground truth recordings")
+    if database_type in ('postgres', 'sqlite'):
+        return database_class(connection_string, options)
     else:
-        raise ValueError(f"Unsupported db: {database_type} (should be one of {dbdict.keys()})")
+        return database_class()
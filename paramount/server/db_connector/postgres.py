@@ -2,33 +2,285 @@ import pandas as pd
 import numpy as np
 from .db import Database
 import traceback
-from sqlalchemy import create_engine, inspect, Table, MetaData, select, text, desc, and_
-from sqlalchemy.dialects.postgresql import JSONB, UUID, TEXT, insert as pg_insert
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, inspect, Table, MetaData, select, text, desc, and_, tuple_, cast
+from sqlalchemy.dialects.postgresql import JSON, JSONB, UUID, TEXT, insert as pg_insert
+from sqlalchemy.sql import sqltypes
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 import psycopg2
-import uuid
-import ast
+import threading
+import io
+import json
+import os
+import weakref
+from time import monotonic, perf_counter, sleep
+from paramount.server.indexes import ensure_indexes_in_background
 
 
-def try_literal_eval(x):
-    try:
-        return ast.literal_eval(x) if isinstance(x, str) else x
-    except (ValueError, SyntaxError):
-        return x
+def copy_kind(column_type):
+    """How values of a column type are formatted for COPY, or None if such columns go through INSERT instead."""
+    if isinstance(column_type, (JSON, JSONB)):
+        return 'json'
+    if isinstance(column_type, (UUID, sqltypes.Uuid)):
+        return 'text'
+    if isinstance(column_type, sqltypes.DateTime):
+        return 'timestamp'
+    if isinstance(column_type, sqltypes.Boolean):
+        return 'boolean'
+    if isinstance(column_type, sqltypes.Integer):  # Includes BIGINT and SMALLINT
+        return 'integer'
+    if isinstance(column_type, (sqltypes.Float, sqltypes.Numeric)):
+        return 'number'
+    if isinstance(column_type, sqltypes.String):  # Includes TEXT and VARCHAR
+        return 'text'
+    return None
+
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def is_null(value):
+    return value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+def is_unique_violation(error):
+    """Whether a psycopg2 error, as raised by COPY or wrapped by SQLAlchemy, is a duplicate key."""
+    return isinstance(getattr(error, 'orig', error), psycopg2.errors.UniqueViolation)
+
+
+def format_copy_value(value, kind):
+    """One value in COPY text format. NaN, NaT and NA are NULL, like with to_sql."""
+    if is_null(value):
+        return '\\N'
+    if kind == 'json':
+        value = json.dumps(value, default=str)
+    elif kind == 'timestamp':
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    elif kind == 'boolean':
+        value = 't' if value else 'f'
+    elif kind == 'integer' and isinstance(value, float) and value.is_integer():
+        value = str(int(value))  # Integers of columns that pandas made float64 because of NaNs: COPY rejects '100.0'
+    elif not isinstance(value, str):
+        value = json.dumps(value, default=str) if isinstance(value, (list, dict)) else str(value)
+    return value.translate(COPY_ESCAPES)
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Document storage (storage = "jsonb"): besides the paramount__ metadata columns, a table has one JSONB document per
+# group of flat columns, keyed by the flat column names. Columns that match no prefix go to paramount__extra
+DOCUMENT_COLUMNS = {
+    'paramount__inputs': ('input_args__', 'input_kwargs__'),
+    'paramount__outputs': ('output__',),
+    'paramount__extra': (),
+}
+
+
+def document_column(name):
+    for doc_column, prefixes in DOCUMENT_COLUMNS.items():
+        if name.startswith(prefixes):
+            return doc_column
+    return 'paramount__extra'
+
+
+def document_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value  # Timestamps, which JSON can't hold
+
+
+def create_index_sql(table_name, index, column_sql=quote_identifier):
+    columns = ', '.join(f'{column_sql(col)} {order}' for col, order in index['columns'])
+    using = f" USING {index['using']}" if index.get('using') else ''
+    sql = (f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote_identifier(index['name'])} "
+           f"ON {quote_identifier(table_name)}{using} ({columns})")
+    return sql + f" WHERE {index['where']}" if index.get('where') else sql
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that keeps count of checkouts and of the time they took, waits for a free connection included."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'timeouts': 0, 'checkout_ms_total': 0.0, 'checkout_ms_max': 0.0}
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.stats['timeouts'] += 1
+            raise
+        finally:
+            elapsed_ms = (perf_counter() - start) * 1000
+            with self.stats_lock:
+                self.stats['checkouts'] += 1
+                self.stats['checkout_ms_total'] += elapsed_ms
+                self.stats['checkout_ms_max'] = max(self.stats['checkout_ms_max'], elapsed_ms)
+
+    def recreate(self):  # engine.dispose() swaps in a new pool: keep counting where this one left off
+        pool = super().recreate()
+        pool.stats, pool.stats_lock = self.stats, self.stats_lock
+        return pool
+
+
+def dispose_after_fork(engine):
+    """
+    Forked children (eg. gunicorn workers forked after the app was imported) must not use the connections their parent
+    opened: the child starts with an empty pool instead, without closing the parent's connections (close=False).
+    """
+    if not hasattr(os, 'register_at_fork'):  # Windows: no fork
+        return
+    engine_ref = weakref.ref(engine)
+
+    def after_in_child():
+        forked_engine = engine_ref()
+        if forked_engine is not None:
+            forked_engine.dispose(close=False)
+    os.register_at_fork(after_in_child=after_in_child)
+
+
+def engine_options(options):
+    """create_engine() arguments from the [db.postgres] settings."""
+    connect_args = {}
+    statement_timeout = options.get('statement_timeout', 0)  # Seconds, 0 for none
+    if statement_timeout:
+        connect_args['options'] = f'-c statement_timeout={int(float(statement_timeout) * 1000)}'
+    pool_recycle = options.get('pool_recycle', 1800)
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(options.get('pool_size', 5)),
+        'max_overflow': int(options.get('max_overflow', 10)),
+        'pool_timeout': float(options.get('pool_timeout', 30)),
+        'pool_pre_ping': bool(options.get('pool_pre_ping', True)),
+        'pool_recycle': int(pool_recycle) if pool_recycle else -1,
+        'connect_args': connect_args,
+    }
+
+
+# One engine (and pool) per database url and pool settings, shared by all instances: record()'s and the API's
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(connection_string, options):
+    kwargs = engine_options(options)
+    key = (connection_string, json.dumps({k: v for k, v in kwargs.items() if k != 'poolclass'}, sort_keys=True))
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(connection_string, **kwargs)
+            dispose_after_fork(_engines[key])
+        return _engines[key]
+
+
+# (database url, table_name) -> (reflected Table, reflected_at), see PostgresDatabase.get_table
+_reflected_tables = {}
+_schema_lock = threading.Lock()
 
 
 class PostgresDatabase(Database):
-    def __init__(self, connection_string):  # connection string may need postgresql+psycopg2 as prefix to work
-        self.engine = create_engine(connection_string)
+    def __init__(self, connection_string, options=None):  # connection string may need postgresql+psycopg2 as prefix
+        options = options or {}
+        self.engine = get_engine(connection_string, options)
         self.existing_tables = {}
 
+        # Reflected Table objects are cached, so that requests don't pay for catalog queries. Entries are dropped when
+        # paramount alters the table, and expire after schema_cache_ttl seconds (0 disables the cache) to pick up
+        # columns added by other processes. The cache is shared by all instances on the same database (eg. record()'s
+        # and the API's)
+        self.schema_cache_ttl = float(options.get('schema_cache_ttl', 5))
+
+        # 'copy' bulk loads existing tables with COPY FROM STDIN, 'to_sql' always uses DataFrame.to_sql
+        self.ingest_method = options.get('ingest_method', 'copy')
+        self._column_kinds = {}  # table_name -> {column: copy kind}
+
+        self.managed_indexes = {}  # table_name -> index specs, see ensure_indexes()
+
+        # Layout of new tables: 'columns' has one column per input/output, 'jsonb' keeps them in JSONB documents so
+        # that new arguments or output keys never need an ALTER TABLE. Existing tables keep the layout they have
+        self.storage = options.get('storage', 'columns')
+
+        # Seconds ensure_indexes waits for another process' index builds before giving up until the next start
+        self.index_lock_timeout = float(options.get('index_lock_timeout', 600))
+
+    def pool_status(self):
+        pool = self.engine.pool
+        with pool.stats_lock:
+            stats = dict(pool.stats)
+        stats['checkout_ms_avg'] = stats['checkout_ms_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return {'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': max(pool.overflow(), 0), **stats}
+
+    def _schema_key(self, table_name):
+        return self.engine.url.render_as_string(hide_password=False), table_name
+
+    def get_table(self, table_name, columns=()):
+        """
+        The reflected table. columns are the names the caller is about to use: a cached table that lacks one of them
+        is reflected again, as another process (eg. the app's record()) may have added it since.
+        """
+        key = self._schema_key(table_name)
+        with _schema_lock:
+            cached = _reflected_tables.get(key)
+            if cached is not None and monotonic() - cached[1] < self.schema_cache_ttl:
+                table = cached[0]
+                # Document tables keep unknown names in their documents, they never lack a column
+                if 'paramount__inputs' in table.columns or all(col in table.columns for col in columns):
+                    return table
+            table = Table(table_name, MetaData(), autoload_with=self.engine)
+            _reflected_tables[key] = (table, monotonic())
+            return table
+
+    def invalidate_schema(self, table_name):
+        with _schema_lock:
+            _reflected_tables.pop(self._schema_key(table_name), None)
+            self._column_kinds.pop(table_name, None)
+
     def create_or_append(self, dataframe, table_name, primary_key):
+        try:
+            self.append_rows(dataframe, table_name, primary_key)
+        except (SQLAlchemyError, psycopg2.Error) as e:
+            if not is_unique_violation(e):
+                raise
+            # Eg. a spooled batch delivered again after a crash: only the rows not in the table yet are written
+            dataframe = self.drop_existing_rows(dataframe, table_name, primary_key)
+            print(f"PARAMOUNT: Some rows were already in {table_name}, appending the {len(dataframe)} others")
+            if len(dataframe):
+                self.append_rows(dataframe, table_name, primary_key)
+
+    def drop_existing_rows(self, dataframe, table_name, primary_key):
+        table = self.get_table(table_name)
+        ids = dataframe[primary_key].astype(str).tolist()
+        id_type = table.c[primary_key].type.compile(dialect=self.engine.dialect)
+        with self.engine.connect() as conn:
+            existing = conn.execute(text(f'SELECT {quote_identifier(primary_key)}::text FROM '
+                                         f'{quote_identifier(table_name)} WHERE {quote_identifier(primary_key)} = '
+                                         f'ANY(CAST(:ids AS {id_type}[]))'), {'ids': ids}).scalars().all()
+        return dataframe[~dataframe[primary_key].astype(str).isin(existing)]
+
+    def append_rows(self, dataframe, table_name, primary_key):
+        if self.table_exists(table_name):
+            if self.is_document_table(table_name):
+                dataframe = self.to_documents(dataframe, [col.name for col in self.get_table(table_name).columns])
+        elif self.storage == 'jsonb':  # The metadata columns of the first batch are the table's fixed columns
+            dataframe = self.to_documents(dataframe, [primary_key] + [col for col in dataframe.columns
+                                                                      if col.startswith('paramount__')])
+
+        # Fast path: tables that already have every column, with types COPY can load, are bulk loaded with COPY
+        if self.ingest_method == 'copy' and self.table_exists(table_name):
+            column_kinds = self.get_column_kinds(table_name, dataframe.columns)
+            if all(column_kinds.get(col) is not None for col in dataframe.columns):
+                self.copy_rows(dataframe, table_name, column_kinds)
+                return
+
         # Make a copy of the DataFrame to avoid modifying the original
         df_copy = dataframe.copy()
         dtype = {}
         for col in df_copy.columns:
             # Get the first non-null element in the column
-            first_non_null = df_copy[col].dropna().iloc[0] if not df_copy[col].dropna().empty else None
+            first_valid_index = df_copy[col].first_valid_index()
+            first_non_null = df_copy[col].loc[first_valid_index] if first_valid_index is not None else None
             if first_non_null is not None:
                 # If the first non-null element is a string, use the string data type
                 if isinstance(first_non_null, str):
@@ -44,30 +296,111 @@ class PostgresDatabase(Database):
 
         try:  # Try to append the copy of the DataFrame to the SQL table, handle potential SQL errors
             newly_created = not self.table_exists(table_name)
-            df_copy.to_sql(table_name, self.engine, if_exists='append', dtype=dtype, index=True)
+            # Multi-row INSERTs: for new tables, new columns, and column types COPY isn't used for
+            df_copy.to_sql(table_name, self.engine, if_exists='append', dtype=dtype, index=True, method='multi',
+                           chunksize=1000)
 
             if newly_created:
                 print(f"detected newly created table, creating primary key {primary_key}")
                 with self.engine.begin() as conn:
                     sql = text(f'ALTER TABLE {table_name} ADD PRIMARY KEY ({primary_key})')
                     conn.execute(sql)
+                self.invalidate_schema(table_name)
+                self.ensure_managed_indexes_later(table_name)
         except SQLAlchemyError as e:
             if issubclass(psycopg2.errors.lookup(e.orig.pgcode), psycopg2.errors.UndefinedColumn):
-                self.create_columns(df_copy, table_name)
+                self.create_columns(df_copy, table_name, dtype)
+                # Retry now that the columns exist, so that the batch that hit the error isn't lost
+                df_copy.to_sql(table_name, self.engine, if_exists='append', dtype=dtype, index=True, method='multi',
+                               chunksize=1000)
             else:
-                err_tcb = traceback.format_exc()
-                print(f"An error occurred while appending to {table_name}: {e}: {err_tcb}")
+                if not is_unique_violation(e):  # Duplicates are handled by create_or_append
+                    err_tcb = traceback.format_exc()
+                    print(f"An error occurred while appending to {table_name}: {e}: {err_tcb}")
                 raise  # Re-raise the exception for further handling if necessary
 
-    def create_columns(self, df, table_name):
+    def is_document_table(self, table_name):
+        return 'paramount__inputs' in self.get_table(table_name).columns
+
+    def to_documents(self, dataframe, fixed_columns):
+        """The rows of a flat DataFrame in document layout: fixed_columns are kept, the rest is folded into documents."""
+        fixed = [col for col in dataframe.columns if col in fixed_columns and col not in DOCUMENT_COLUMNS]
+        folded = [col for col in dataframe.columns if col not in fixed and col not in DOCUMENT_COLUMNS]
+        documents = dataframe[fixed].copy()
+        # (to_dict gives no records at all for a frame without columns, eg. session rows that are all metadata)
+        records = dataframe[folded].to_dict(orient='records') if folded else [{}] * len(dataframe)
+        for doc_column in DOCUMENT_COLUMNS:
+            doc_keys = [col for col in folded if document_column(col) == doc_column]
+            # Missing values are left out of the document: NaN isn't valid JSON, and sparse documents stay small
+            documents[doc_column] = [{key: document_value(record[key]) for key in doc_keys
+                                      if not is_null(record[key])} for record in records]
+        return documents
+
+    def column_expression(self, table, name):
+        """The column, or for document tables a flat column that lives in a document, as text (like ->> gives)."""
+        if name in table.columns:
+            return table.c[name]
+        if 'paramount__inputs' in table.columns:
+            return table.c[document_column(name)][name].astext
+        raise KeyError(f"{table.name} has no column {name}")
+
+    def expand_documents(self, df):
+        """Project the documents of a document table back onto the flat columns the UI works with."""
+        doc_columns = [col for col in DOCUMENT_COLUMNS if col in df.columns]
+        if not doc_columns:
+            return df
+        expanded = [pd.DataFrame([doc if isinstance(doc, dict) else {} for doc in df[col]], index=df.index)
+                    for col in doc_columns]
+        return pd.concat([df.drop(columns=doc_columns)] + expanded, axis=1)
+
+    def get_column_kinds(self, table_name, columns=()):
+        """How each column of the table is formatted for COPY (see copy_kind), cached along with the schema."""
+        with _schema_lock:
+            column_kinds = self._column_kinds.get(table_name)
+        if column_kinds is None or any(col not in column_kinds for col in columns):
+            table = self.get_table(table_name, columns)
+            column_kinds = {column.name: copy_kind(column.type) for column in table.columns}
+            with _schema_lock:
+                self._column_kinds[table_name] = column_kinds
+        return column_kinds
+
+    def copy_rows(self, dataframe, table_name, column_kinds):
+        # COPY ... FROM STDIN in text format: tab separated, backslash escaped, \N for NULL
+        columns = list(dataframe.columns)
+        formatted_columns = [[format_copy_value(value, column_kinds[col]) for value in dataframe[col].tolist()]
+                             for col in columns]
+        buffer = io.StringIO()
+        for row in zip(*formatted_columns):
+            buffer.write('\t'.join(row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        column_list = ', '.join(quote_identifier(col) for col in columns)
+        try:
+            with self.engine.begin() as conn:
+                cursor = conn.connection.cursor()  # Raw psycopg2 cursor, within the transaction of conn
+                cursor.copy_expert(f'COPY {quote_identifier(table_name)} ({column_list}) FROM STDIN', buffer)
+        except Exception as e:
+            if not is_unique_violation(e):  # Duplicates are handled by create_or_append
+                err_tcb = traceback.format_exc()
+                print(f"An error occurred while copying {len(dataframe)} rows into {table_name}: {e}: {err_tcb}")
+            raise
+
+    def create_columns(self, df, table_name, dtype=None):
         print(f"PARAMOUNT: UndefinedColumn error - Adding new columns to table to prevent this for future invocations")
+        dtype = dtype or {}
         new_cols = [col for col in df.columns if col not in self.existing_tables.get(table_name, [])]
-        for column in new_cols:
-            sql = text(f'ALTER TABLE {table_name} ADD COLUMN {column} TEXT')
+        # One ALTER TABLE for all of them: a single, short lock on the table. IF NOT EXISTS, as other processes
+        # may be adding the same columns at the same time
+        add_columns = ', '.join(f'ADD COLUMN IF NOT EXISTS {quote_identifier(column)} '
+                                f'{"JSONB" if dtype.get(column) is JSONB else "TEXT"}' for column in new_cols)
+        if add_columns:
             with self.engine.begin() as conn:
-                conn.execute(sql)
-                print(f"Added column {column} to {table_name}.")
+                conn.execute(text(f'ALTER TABLE {quote_identifier(table_name)} {add_columns}'))
+            print(f"Added columns {new_cols} to {table_name}.")
         self.existing_tables[table_name] = self.existing_tables.get(table_name, []) + new_cols
+        self.invalidate_schema(table_name)
+        self.ensure_managed_indexes_later(table_name)  # Indexes on columns that did not exist before
 
     def table_exists(self, table_name):
         if table_name in self.existing_tables:
@@ -85,8 +418,9 @@ class PostgresDatabase(Database):
         # Replacing pd.NaT with None so DB accepts it, otherwise get: invalid input syntax for type timestamp: "NaT"
         df = df.replace({np.nan: None})
 
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=self.engine)
+        table = self.get_table(table_name, df.columns)
+        if self.is_document_table(table_name):
+            df = self.to_documents(df, [col.name for col in table.columns])
 
         rows = df.to_dict(orient='records')
         unique_constraint_column = 'paramount__recording_id'  # Must pre-exist as primary key for this to work?
@@ -108,33 +442,97 @@ class PostgresDatabase(Database):
             print(f"{e}: {err_tcb}")
             raise
 
+    def update_fields(self, table_name, updates):
+        """
+        Narrow UPDATE of only the fields that changed: updates maps recording ids to {column: new value}. Rows that
+        set the same columns are updated together by one UPDATE ... FROM (VALUES ...), all in a single transaction.
+        In document tables, fields that live in a document are merged into it with ||. Returns the rows updated.
+        """
+        table = self.get_table(table_name, {col for fields in updates.values() for col in fields})
+        document_table = self.is_document_table(table_name)
+        primary_key = 'paramount__recording_id'
+
+        groups = {}  # Sorted tuple of assigned columns -> [(recording id, {column: value})]
+        for recording_id, fields in updates.items():
+            assignments = {}
+            for col, value in fields.items():
+                if col == primary_key:
+                    continue
+                if col in table.columns and col not in DOCUMENT_COLUMNS:
+                    assignments[col] = value
+                elif document_table and col not in DOCUMENT_COLUMNS:
+                    assignments.setdefault(document_column(col), {})[col] = document_value(value)
+                else:
+                    raise ValueError(f"{table_name} has no column {col}")
+            if assignments:
+                groups.setdefault(tuple(sorted(assignments)), []).append((str(recording_id), assignments))
+
+        updated = 0
+        try:
+            with self.engine.begin() as conn:
+                for columns, rows in groups.items():
+                    for start in range(0, len(rows), 1000):  # Bounds the number of bind parameters per statement
+                        updated += conn.execute(*self.update_fields_statement(table, columns,
+                                                                              rows[start:start + 1000])).rowcount
+        except Exception as e:
+            err_tcb = traceback.format_exc()
+            print(f"{e}: {err_tcb}")
+            raise
+        return updated
+
+    def update_fields_statement(self, table, columns, rows):
+        """UPDATE ... FROM (VALUES ...): every value is bound as text, then cast to the type of its column."""
+        def column_type(col):
+            return table.c[col].type.compile(dialect=self.engine.dialect)
+
+        def bind_value(value, document):
+            if document or isinstance(value, (list, dict)):
+                return json.dumps(value, default=str)
+            if is_null(value):
+                return None
+            return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+        set_clauses = []
+        for i, col in enumerate(columns):
+            if col in DOCUMENT_COLUMNS:
+                set_clauses.append(f"{quote_identifier(col)} = coalesce(t.{quote_identifier(col)}, '{{}}'::jsonb) "
+                                   f"|| CAST(v.c{i} AS JSONB)")
+            else:
+                set_clauses.append(f"{quote_identifier(col)} = CAST(v.c{i} AS {column_type(col)})")
+
+        params = {}
+        values = []
+        for r, (recording_id, assignments) in enumerate(rows):
+            params[f'r{r}_id'] = recording_id
+            for i, col in enumerate(columns):
+                params[f'r{r}_c{i}'] = bind_value(assignments[col], col in DOCUMENT_COLUMNS)
+            values.append('(' + ', '.join([f':r{r}_id'] + [f':r{r}_c{i}' for i in range(len(columns))]) + ')')
+
+        primary_key = table.c.paramount__recording_id
+        value_names = ', '.join(['id'] + [f'c{i}' for i in range(len(columns))])
+        sql = (f"UPDATE {quote_identifier(table.name)} AS t SET {', '.join(set_clauses)} "
+               f"FROM (VALUES {', '.join(values)}) AS v({value_names}) "
+               f"WHERE t.{quote_identifier(primary_key.name)} = CAST(v.id AS {column_type(primary_key.name)})")
+        return text(sql), params
+
     def get_generic_table(self, table, stmt):
-        table_dtypes = {column.name: str(column.type) for column in table.columns}
         with self.engine.connect() as conn:
-            df = pd.read_sql(stmt, conn)
-
-            # Convert UUID cols to str so Evaluate.py merged df has a successful right join on 'paramount__record_id'
-            uuid_cols = [
-                col for col in df.columns
-                if df[col].dtype == 'object'
-                   and not df[col].dropna().empty  # Ensure non-empty
-                   and isinstance(df[col].dropna().iloc[0], uuid.UUID)  # Check for UUID type
-            ]
-            df[uuid_cols] = df[uuid_cols].astype(str)
-
-            # Attempt to convert any JSONB/JSON column types from the table into either list or dict
-            json_cols = [col for col, dtype in table_dtypes.items() if dtype in ['JSONB', 'JSON']]
-            df.update(df[json_cols].applymap(try_literal_eval))
-            return df
+            df = pd.read_sql_query(stmt, conn)  # Unlike read_sql, no has_table() catalog probe per call
+
+        # Decoding follows the reflected column types. JSON/JSONB values are already decoded by the driver
+        for column in table.columns:
+            if column.name in df.columns and isinstance(column.type, (UUID, sqltypes.Uuid)):
+                # Convert UUID cols to str so Evaluate.py merged df has a successful right join on 'paramount__record_id'
+                df[column.name] = df[column.name].map(str, na_action='ignore')
+        return self.expand_documents(df)
 
     def get_sessions(self, table_name, split_by_id, identifier_column_name, identifier_value):
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=self.engine)
+        table = self.get_table(table_name, [identifier_column_name] if split_by_id else ())
 
         conditions = []
 
         if split_by_id:
-            identifier_column = table.c[identifier_column_name]  # Get the column to filter on
+            identifier_column = self.column_expression(table, identifier_column_name)  # Get the column to filter on
             # ID-based filtering, uses SQLAlchemy == operator overload (does not evaluate to [True] or [False])
             conditions.append(identifier_column == identifier_value)
 
@@ -148,9 +546,9 @@ class PostgresDatabase(Database):
         return df
 
     def get_recordings(self, table_name, evaluated_rows_only, split_by_id, identifier_column_name=None,
-                       identifier_value=None, recording_ids=None):
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=self.engine)
+                       identifier_value=None, recording_ids=None, page_size=100, cursor=None, start_time=None,
+                       end_time=None, function_name=None):
+        table = self.get_table(table_name, [identifier_column_name] if split_by_id else ())
 
         conditions = []
 
@@ -160,20 +558,201 @@ class PostgresDatabase(Database):
             conditions.append(condition)
 
         if split_by_id:
-            identifier_column = table.c[identifier_column_name]  # Get the column to filter on
+            identifier_column = self.column_expression(table, identifier_column_name)  # Get the column to filter on
             # ID-based filtering, uses SQLAlchemy == operator overload (does not evaluate to [True] or [False])
             conditions.append(identifier_column == identifier_value)
 
         if evaluated_rows_only:  # e.g. fetch only rows where the evaluation is not empty string: ''
-            conditions.append(table.c.paramount__evaluation.notilike(''))
+            # Plain inequality rather than NOT ILIKE, so that the planner can use the partial index on evaluated rows
+            conditions.append(table.c.paramount__evaluation != '')
 
-        # Prepare the select statement with a where clause
+        recorded_at = table.c.paramount__recorded_at
+        if start_time is not None:
+            conditions.append(recorded_at >= start_time)
+        if end_time is not None:
+            conditions.append(recorded_at < end_time)
+        if function_name:
+            conditions.append(table.c.paramount__function_name == function_name)
+
+        if cursor is not None:  # Keyset pagination: rows strictly after the last one of the previous page
+            cursor_recorded_at, cursor_recording_id = cursor
+            conditions.append(tuple_(recorded_at, table.c.paramount__recording_id)
+                              < tuple_(cursor_recorded_at, cast(cursor_recording_id, UUID)))
+
+        # Prepare the select statement with a where clause. The recording id breaks ties between equal timestamps,
+        # so that pages are stable and every row is seen exactly once
         stmt = (
             select(table)
             .where(and_(*conditions))  # Unpack the conditions list into and_()
-            .order_by(desc('paramount__recorded_at'))
-            .limit(100)
+            .order_by(desc(recorded_at), desc(table.c.paramount__recording_id))
+            .limit(page_size)
         )
         df = self.get_generic_table(table, stmt)
         df['paramount__evaluation'] = df['paramount__evaluation'].replace("", None)
         return df
+
+    def ensure_indexes(self, table_name, indexes):
+        """
+        Build the missing indexes among the given specs (see paramount.server.indexes) with CREATE INDEX CONCURRENTLY,
+        which doesn't block writes to the table. Indexes left invalid by an interrupted build are dropped and rebuilt.
+        Tables (or columns) that don't exist yet get their indexes once create_or_append creates them.
+        Returns the names of the indexes that were built.
+        """
+        self.managed_indexes[table_name] = indexes
+        if not self.table_exists(table_name):
+            return []
+        indexes, table_columns, column_sql = self.index_layout(table_name, indexes)
+
+        created = []
+        # Concurrent index builds can't run inside a transaction block
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('SET statement_timeout = 0'))  # Builds on big tables outlast any configured timeout
+            try:
+                # Several processes (API workers, recording apps) bootstrap the same tables, and concurrent builds
+                # that wait on each other deadlock: builds are serialized, the others then find the indexes there.
+                # Polled rather than waited for, as a session blocked on the lock holds a snapshot the build waits out.
+                # A stalled holder (or a leaked lock) is given up on: the next start of a process tries again
+                deadline = monotonic() + self.index_lock_timeout
+                while not conn.execute(text('SELECT pg_try_advisory_lock(hashtext(:key))'),
+                                       {'key': 'paramount_indexes'}).scalar():
+                    if monotonic() >= deadline:
+                        print(f"PARAMOUNT: Not creating indexes on {table_name}: another process has been building "
+                              f"indexes for over {self.index_lock_timeout:.0f}s, retrying on the next start")
+                        return created
+                    sleep(1)
+                try:
+                    for index in indexes:
+                        if self.ensure_index(conn, table_name, index, table_columns, column_sql):
+                            created.append(index['name'])
+                finally:
+                    conn.execute(text('SELECT pg_advisory_unlock(hashtext(:key))'), {'key': 'paramount_indexes'})
+            finally:
+                # Session settings outlive the checkout: the connection goes back to the pool with the configured
+                # statement_timeout (set at connect time, so it is what RESET restores), or not at all
+                try:
+                    conn.execute(text('RESET statement_timeout'))
+                except SQLAlchemyError:
+                    conn.invalidate()
+        return created
+
+    def ensure_index(self, conn, table_name, index, table_columns, column_sql):
+        name = index['name']
+        missing_columns = [col for col, _ in index['columns'] if col not in table_columns]
+        if missing_columns:
+            print(f"PARAMOUNT: Not creating index {name} yet, {table_name} has no column {missing_columns}")
+            return False
+        try:
+            state = conn.execute(text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+                                 {'name': quote_identifier(name)}).first()
+            if state is not None and state[0]:
+                return False
+            if state is not None:
+                print(f"PARAMOUNT: Rebuilding invalid index {name}")
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {quote_identifier(name)}'))
+            print(f"PARAMOUNT: Creating index {name} on {table_name}")
+            conn.execute(text(create_index_sql(table_name, index, column_sql)))
+            return True
+        except SQLAlchemyError as e:
+            print(f"PARAMOUNT: Could not create index {name}: {e}: {traceback.format_exc()}")
+            return False
+
+    def index_layout(self, table_name, indexes):
+        """
+        The indexes to build on an existing table, the columns they can use, and how to render those columns.
+        Flat columns kept in documents are indexed as ->> expressions (the same get_recordings filters on), and
+        the documents themselves get GIN indexes for containment queries.
+        """
+        table_columns = {column.name for column in self.get_table(table_name).columns}
+        if not self.is_document_table(table_name):
+            return indexes, table_columns, quote_identifier
+
+        def column_sql(col):
+            if col in table_columns:
+                return quote_identifier(col)
+            return f"({quote_identifier(document_column(col))} ->> '{col.replace(chr(39), chr(39) * 2)}')"
+
+        indexes = indexes + [{'name': f'{table_name}_{doc_column.replace("paramount__", "")}_gin_idx',
+                              'columns': [(doc_column, 'jsonb_path_ops')], 'where': None, 'using': 'gin'}
+                             for doc_column in DOCUMENT_COLUMNS]
+        return indexes, table_columns | {col for index in indexes for col, _ in index['columns']}, column_sql
+
+    def ensure_managed_indexes_later(self, table_name):
+        if table_name in self.managed_indexes:
+            ensure_indexes_in_background(self, {table_name: self.managed_indexes[table_name]})
+
+    def get_index_health(self, table_name, indexes):
+        """
+        One entry per index of the table, plus one per expected index that is missing. status is 'ok', 'missing',
+        'building' (a concurrent build in progress), 'invalid' (an interrupted build), 'unused' (never scanned) or
+        'pending' (the table doesn't exist yet, its indexes are built along with it).
+        """
+        column_sql = quote_identifier
+        rows = []
+        table_exists = self.table_exists(table_name)
+        if table_exists:
+            indexes, _, column_sql = self.index_layout(table_name, indexes)
+            with self.engine.connect() as conn:
+                rows = conn.execute(text(
+                    'SELECT c.relname AS name, i.indisvalid AS valid, pg_relation_size(c.oid) AS size_bytes, '
+                    'coalesce(s.idx_scan, 0) AS scans, pg_get_indexdef(c.oid) AS definition, '
+                    'EXISTS (SELECT 1 FROM pg_stat_progress_create_index p WHERE p.index_relid = c.oid) AS building '
+                    'FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                    'LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid '
+                    'WHERE i.indrelid = to_regclass(:table_name) ORDER BY c.relname'),
+                    {'table_name': quote_identifier(table_name)}).mappings().all()
+
+        expected = {index['name'] for index in indexes}
+        health = []
+        for row in rows:
+            if row['building']:
+                status = 'building'
+            elif not row['valid']:
+                status = 'invalid'
+            elif row['scans'] == 0:
+                status = 'unused'
+            else:
+                status = 'ok'
+            health.append({'table': table_name, 'name': row['name'], 'managed': row['name'] in expected,
+                           'status': status, 'size_bytes': row['size_bytes'], 'scans': row['scans'],
+                           'definition': row['definition']})
+        present = {row['name'] for row in rows}
+        health += [{'table': table_name, 'name': index['name'], 'managed': True,
+                    'status': 'missing' if table_exists else 'pending',
+                    'size_bytes': 0, 'scans': 0, 'definition': create_index_sql(table_name, index, column_sql)}
+                   for index in indexes if index['name'] not in present]
+        return health
+
+    def ensure_replay_cache_table(self, table_name):
+        if table_name in self.existing_tables:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(f'CREATE TABLE IF NOT EXISTS {table_name} ('
+                              'cache_key TEXT PRIMARY KEY, function_name TEXT, result JSONB, '
+                              'created_at TIMESTAMPTZ NOT NULL DEFAULT now(), expires_at TIMESTAMPTZ)'))
+        self.existing_tables[table_name] = ['cache_key', 'function_name', 'result', 'created_at', 'expires_at']
+
+    def get_cached_replay(self, table_name, cache_key):
+        self.ensure_replay_cache_table(table_name)
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f'SELECT result::text FROM {table_name} WHERE cache_key = :cache_key '
+                                    'AND (expires_at IS NULL OR expires_at > now())'),
+                               {'cache_key': cache_key}).first()
+        return row[0] if row else None
+
+    def set_cached_replay(self, table_name, cache_key, function_name, result_json, expires_at):
+        self.ensure_replay_cache_table(table_name)
+        with self.engine.begin() as conn:
+            conn.execute(text(f'INSERT INTO {table_name} (cache_key, function_name, result, expires_at) '
+                              'VALUES (:cache_key, :function_name, CAST(:result AS JSONB), :expires_at) '
+                              'ON CONFLICT (cache_key) DO UPDATE SET function_name = EXCLUDED.function_name, '
+                              'result = EXCLUDED.result, created_at = now(), expires_at = EXCLUDED.expires_at'),
+                         {'cache_key': cache_key, 'function_name': function_name, 'result': result_json,
+                          'expires_at': expires_at})
+
+    def prune_cached_replays(self, table_name, max_entries):
+        # Drop expired entries, then the oldest ones beyond max_entries
+        self.ensure_replay_cache_table(table_name)
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {table_name} WHERE expires_at <= now()'))
+            conn.execute(text(f'DELETE FROM {table_name} WHERE cache_key IN (SELECT cache_key FROM {table_name} '
+                              'ORDER BY created_at DESC OFFSET :max_entries)'), {'max_entries': max_entries})
@@ -0,0 +1,347 @@
+# SQLite implementation: a single file database for dev and single-node deployments, no external service needed
+from .db import Database
+import json
+import os
+import sqlite3
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+from paramount.server.indexes import ensure_indexes_in_background
+
+# Declared column types. SQLite only keeps an affinity, so the declared names carry how values are decoded on the
+# way out. The JSON and timestamp ones contain TEXT, to get TEXT affinity (a bare JSON type would get NUMERIC)
+JSON_TYPE = 'JSON_TEXT'
+TIMESTAMP_TYPE = 'TIMESTAMP_TEXT'
+BOOLEAN_TYPE = 'BOOLEAN_INTEGER'
+
+
+def is_null(value):
+    return value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+def column_type(value):
+    """Declared type of a new column, from its first non-null value."""
+    if isinstance(value, bool):
+        return BOOLEAN_TYPE
+    if isinstance(value, int):
+        return 'INTEGER'
+    if isinstance(value, float):
+        return 'REAL'
+    if isinstance(value, (list, dict)):
+        return JSON_TYPE
+    if isinstance(value, datetime):  # Includes pd.Timestamp
+        return TIMESTAMP_TYPE
+    return 'TEXT'
+
+
+def timestamp_text(value):
+    """Fixed width UTC text, so that comparing and sorting the text compares and sorts the timestamps."""
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+
+
+def encode_value(value, declared_type):
+    if is_null(value):
+        return None
+    if declared_type == JSON_TYPE or isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    if declared_type == TIMESTAMP_TYPE:
+        return timestamp_text(value)
+    if declared_type == BOOLEAN_TYPE:
+        return int(bool(value))
+    if isinstance(value, (str, int, float)):
+        return value
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteDatabase(Database):
+    """
+    Tables have one column per input/output, like the Postgres column layout, added with ALTER TABLE as new ones
+    show up (cheap in SQLite: no rewrite). The database runs in WAL mode, so the recording writer and the API's
+    readers don't block each other. Connections are per thread (and per process, after a fork).
+    """
+
+    def __init__(self, path=None, options=None):
+        options = options or {}
+        self.path = path or options.get('path') or 'paramount.db'
+        self.busy_timeout = int(options.get('busy_timeout', 5000))  # Milliseconds a writer waits for another
+        self._local = threading.local()
+        self._columns = {}  # table_name -> {column: declared type}
+        self._schema_lock = threading.Lock()
+        self.managed_indexes = {}  # table_name -> index specs, see ensure_indexes()
+
+    def connection(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            # isolation_level None: transactions are explicit, see write_transaction()
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # Durable across application crashes, fsyncs at checkpoints
+            conn.execute(f'PRAGMA busy_timeout={self.busy_timeout}')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return self._local.conn
+
+    @contextmanager
+    def write_transaction(self):
+        # IMMEDIATE takes the write lock upfront: a deferred transaction that reads first can fail to upgrade with
+        # SQLITE_BUSY straight away, without waiting for busy_timeout
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def get_columns(self, table_name, refresh=False):
+        with self._schema_lock:
+            columns = self._columns.get(table_name)
+        if columns is None or refresh:
+            rows = self.connection().execute(f'PRAGMA table_info({quote_identifier(table_name)})').fetchall()
+            columns = {row[1]: row[2] for row in rows}
+            with self._schema_lock:
+                self._columns[table_name] = columns
+        return columns
+
+    def table_exists(self, table_name):
+        return bool(self.get_columns(table_name)) or bool(self.get_columns(table_name, refresh=True))
+
+    def create_or_append(self, dataframe, table_name, primary_key):
+        self.insert_rows(dataframe, table_name, primary_key)
+
+    def insert_rows(self, dataframe, table_name, primary_key, upsert=False):
+        columns = list(dataframe.columns)
+        values = {col: dataframe[col].tolist() for col in columns}
+        try:
+            self.ensure_columns(table_name, primary_key, values)
+        except sqlite3.OperationalError:  # Eg. another process added the same column first
+            self.ensure_columns(table_name, primary_key, values, refresh=True)
+        table_columns = self.get_columns(table_name)
+
+        encoded = [[encode_value(value, table_columns[col]) for value in values[col]] for col in columns]
+        column_list = ', '.join(quote_identifier(col) for col in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        sql = f'INSERT INTO {quote_identifier(table_name)} ({column_list}) VALUES ({placeholders})'
+        if upsert:
+            updates = ', '.join(f'{quote_identifier(col)} = excluded.{quote_identifier(col)}'
+                                for col in columns if col != primary_key)
+            sql += f' ON CONFLICT ({quote_identifier(primary_key)}) DO UPDATE SET {updates}'
+        else:  # Rows already in the table are kept, eg. when the spool delivers a batch again after a crash
+            sql += f' ON CONFLICT ({quote_identifier(primary_key)}) DO NOTHING'
+        try:
+            with self.write_transaction() as conn:  # One transaction for the whole batch
+                conn.executemany(sql, list(zip(*encoded)))
+        except Exception as e:
+            err_tcb = traceback.format_exc()
+            print(f"An error occurred while writing {len(dataframe)} rows to {table_name}: {e}: {err_tcb}")
+            raise
+
+    def ensure_columns(self, table_name, primary_key, values, refresh=False):
+        """Create the table, or add the columns it lacks, typed after their first non-null value."""
+        table_columns = self.get_columns(table_name, refresh=refresh)
+        new_columns = {}
+        for col, column_values in values.items():
+            if col not in table_columns:
+                first_non_null = next((value for value in column_values if not is_null(value)), None)
+                new_columns[col] = 'TEXT' if col == primary_key else column_type(first_non_null)
+        if not new_columns:
+            return
+
+        with self.write_transaction() as conn:
+            if not table_columns:
+                definitions = ', '.join(f'{quote_identifier(col)} {declared_type}'
+                                        + (' PRIMARY KEY' if col == primary_key else '')
+                                        for col, declared_type in new_columns.items())
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} ({definitions})')
+            else:
+                for col, declared_type in new_columns.items():
+                    conn.execute(f'ALTER TABLE {quote_identifier(table_name)} '
+                                 f'ADD COLUMN {quote_identifier(col)} {declared_type}')
+        self.get_columns(table_name, refresh=True)
+        if table_name in self.managed_indexes:  # Indexes on the new table, or on columns that did not exist before
+            ensure_indexes_in_background(self, {table_name: self.managed_indexes[table_name]})
+
+    def update_ground_truth(self, df, table_name):
+        if not df.empty:
+            self.insert_rows(df, table_name, 'paramount__recording_id', upsert=True)
+
+    def update_fields(self, table_name, updates):
+        table_columns = self.get_columns(table_name)
+        groups = {}  # Sorted tuple of assigned columns -> [(recording id, {column: value})]
+        for recording_id, fields in updates.items():
+            fields = {col: value for col, value in fields.items() if col != 'paramount__recording_id'}
+            unknown = [col for col in fields if col not in table_columns]
+            if unknown:
+                raise ValueError(f"{table_name} has no column {unknown}")
+            if fields:
+                groups.setdefault(tuple(sorted(fields)), []).append((str(recording_id), fields))
+
+        updated = 0
+        with self.write_transaction() as conn:
+            for columns, rows in groups.items():
+                assignments = ', '.join(f'{quote_identifier(col)} = ?' for col in columns)
+                cursor = conn.executemany(
+                    f'UPDATE {quote_identifier(table_name)} SET {assignments} WHERE paramount__recording_id = ?',
+                    [[encode_value(fields[col], table_columns[col]) for col in columns] + [recording_id]
+                     for recording_id, fields in rows])
+                updated += cursor.rowcount
+        return updated
+
+    def read_table(self, table_name, where=None, params=(), order_by=None, limit=None):
+        """Rows as a DataFrame, with JSON, timestamp and boolean columns decoded after their declared types."""
+        sql = f'SELECT * FROM {quote_identifier(table_name)}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if order_by:
+            sql += f' ORDER BY {order_by}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        cursor = self.connection().execute(sql, list(params))
+        df = pd.DataFrame(cursor.fetchall(), columns=[description[0] for description in cursor.description])
+
+        table_columns = self.get_columns(table_name)
+        if any(col not in table_columns for col in df.columns):  # Columns added by another process
+            table_columns = self.get_columns(table_name, refresh=True)
+        for col in df.columns:
+            declared_type = table_columns.get(col)
+            if declared_type == JSON_TYPE:
+                df[col] = df[col].map(json.loads, na_action='ignore')
+            elif declared_type == TIMESTAMP_TYPE:
+                df[col] = pd.to_datetime(df[col], utc=True, format='ISO8601')
+            elif declared_type == BOOLEAN_TYPE:
+                df[col] = df[col].map(bool, na_action='ignore')
+        return df
+
+    def identifier_condition(self, table_name, identifier_column_name):
+        if identifier_column_name not in self.get_columns(table_name):
+            raise KeyError(identifier_column_name)
+        return f'{quote_identifier(identifier_column_name)} = ?'
+
+    def get_recordings(self, table_name, evaluated_rows_only, split_by_id, identifier_column_name=None,
+                       identifier_value=None, recording_ids=None, page_size=100, cursor=None, start_time=None,
+                       end_time=None, function_name=None):
+        where, params = [], []
+        if recording_ids:  # e.g., fetch only the rows by their recording ids
+            where.append(f'paramount__recording_id IN ({", ".join("?" for _ in recording_ids)})')
+            params += [str(recording_id) for recording_id in recording_ids]
+        if split_by_id:
+            where.append(self.identifier_condition(table_name, identifier_column_name))
+            params.append(identifier_value)
+        if evaluated_rows_only:  # Same predicate as the partial index on evaluated rows
+            where.append("paramount__evaluation <> ''")
+        if start_time is not None:
+            where.append('paramount__recorded_at >= ?')
+            params.append(timestamp_text(start_time))
+        if end_time is not None:
+            where.append('paramount__recorded_at < ?')
+            params.append(timestamp_text(end_time))
+        if function_name:
+            where.append('paramount__function_name = ?')
+            params.append(function_name)
+        if cursor is not None:  # Keyset pagination: rows strictly after the last one of the previous page
+            where.append('(paramount__recorded_at, paramount__recording_id) < (?, ?)')
+            params += [timestamp_text(cursor[0]), str(cursor[1])]
+
+        df = self.read_table(table_name, where, params, limit=page_size,
+                             order_by='paramount__recorded_at DESC, paramount__recording_id DESC')
+        df['paramount__evaluation'] = df['paramount__evaluation'].replace("", None)
+        return df
+
+    def get_sessions(self, table_name, split_by_id, identifier_column_name, identifier_value):
+        where, params = [], []
+        if split_by_id:
+            where.append(self.identifier_condition(table_name, identifier_column_name))
+            params.append(identifier_value)
+        return self.read_table(table_name, where, params, order_by='paramount__session_timestamp DESC')
+
+    def ensure_indexes(self, table_name, indexes):
+        """
+        Create the missing indexes among the given specs (see paramount.server.indexes). Tables (or columns) that
+        don't exist yet get their indexes once they are created. Returns the names of the indexes that were built.
+        """
+        self.managed_indexes[table_name] = indexes
+        table_columns = self.get_columns(table_name, refresh=True)
+        if not table_columns:
+            return []
+        existing = {row[1] for row in self.connection().execute(f'PRAGMA index_list({quote_identifier(table_name)})')}
+
+        created = []
+        for index in indexes:
+            missing_columns = [col for col, _ in index['columns'] if col not in table_columns]
+            if index['name'] in existing or missing_columns:
+                continue
+            columns = ', '.join(f'{quote_identifier(col)} {order}' for col, order in index['columns'])
+            where = f" WHERE {index['where']}" if index.get('where') else ''
+            print(f"PARAMOUNT: Creating index {index['name']} on {table_name}")
+            with self.write_transaction() as conn:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(index['name'])} "
+                             f"ON {quote_identifier(table_name)} ({columns}){where}")
+            created.append(index['name'])
+        return created
+
+    def get_index_health(self, table_name, indexes):
+        # SQLite keeps no scan statistics, and index sizes need the optional dbstat table
+        expected = {index['name']: index for index in indexes}
+        conn = self.connection()
+        table_exists = self.table_exists(table_name)
+        rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                            "ORDER BY name", (table_name,)).fetchall() if table_exists else []
+        health = []
+        for name, sql in rows:
+            try:
+                size_bytes = conn.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = ?', (name,)).fetchone()[0]
+            except sqlite3.OperationalError:
+                size_bytes = 0
+            health.append({'table': table_name, 'name': name, 'managed': name in expected, 'status': 'ok',
+                           'size_bytes': size_bytes or 0, 'scans': 0, 'definition': sql or 'automatic index'})
+        present = {name for name, _ in rows}
+        health += [{'table': table_name, 'name': name, 'managed': True,
+                    'status': 'missing' if table_exists else 'pending', 'size_bytes': 0, 'scans': 0,
+                    'definition': f"{', '.join(col for col, _ in index['columns'])}"
+                                  + (f" WHERE {index['where']}" if index.get('where') else '')}
+                   for name, index in expected.items() if name not in present]
+        return health
+
+    def ensure_replay_cache_table(self, table_name):
+        if self.get_columns(table_name):
+            return
+        with self.write_transaction() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} ('
+                         f'cache_key TEXT PRIMARY KEY, function_name TEXT, result TEXT, '
+                         f'created_at {TIMESTAMP_TYPE} NOT NULL, expires_at {TIMESTAMP_TYPE})')
+        self.get_columns(table_name, refresh=True)
+
+    def get_cached_replay(self, table_name, cache_key):
+        self.ensure_replay_cache_table(table_name)
+        row = self.connection().execute(
+            f'SELECT result FROM {quote_identifier(table_name)} WHERE cache_key = ? '
+            f'AND (expires_at IS NULL OR expires_at > ?)',
+            (cache_key, timestamp_text(datetime.now(timezone.utc)))).fetchone()
+        return row[0] if row else None
+
+    def set_cached_replay(self, table_name, cache_key, function_name, result_json, expires_at):
+        self.ensure_replay_cache_table(table_name)
+        with self.write_transaction() as conn:
+            conn.execute(f'INSERT INTO {quote_identifier(table_name)} '
+                         f'(cache_key, function_name, result, created_at, expires_at) VALUES (?, ?, ?, ?, ?) '
+                         f'ON CONFLICT (cache_key) DO UPDATE SET function_name = excluded.function_name, '
+                         f'result = excluded.result, created_at = excluded.created_at, '
+                         f'expires_at = excluded.expires_at',
+                         (cache_key, function_name, result_json, timestamp_text(datetime.now(timezone.utc)),
+                          timestamp_text(expires_at) if expires_at else None))
+
+    def prune_cached_replays(self, table_name, max_entries):
+        # Drop expired entries, then the oldest ones beyond max_entries
+        self.ensure_replay_cache_table(table_name)
+        table = quote_identifier(table_name)
+        with self.write_transaction() as conn:
+            conn.execute(f'DELETE FROM {table} WHERE expires_at <= ?', (timestamp_text(datetime.now(timezone.utc)),))
+            conn.execute(f'DELETE FROM {table} WHERE cache_key IN (SELECT cache_key FROM {table} '
+                         f'ORDER BY created_at DESC LIMIT -1 OFFSET ?)', (int(max_entries),))
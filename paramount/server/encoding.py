@@ -0,0 +1,76 @@
+import gzip
+import json
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install paramount[brotli], gzip is used otherwise
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/vnd.apache.arrow.stream', 'text/csv', 'text/plain')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # Close to gzip's ratio on JSON at a fraction of the CPU of the higher qualities
+
+
+def clean_none_strings(df):
+    """'None' strings (eg. from CSV round trips) become real None, otherwise UUID upserts fail on them."""
+    for col in df.columns[df.dtypes == object]:
+        is_none_string = df[col] == 'None'
+        if is_none_string.any():
+            df[col] = df[col].where(~is_none_string, None)
+    return df
+
+
+def column_json(series):
+    if isinstance(series.dtype, pd.DatetimeTZDtype):  # Series.to_json leaves the Z off timezone aware timestamps
+        series = series.dt.tz_convert('UTC').dt.strftime('%Y-%m-%dT%H:%M:%S.%f') + 'Z'
+    return series.to_json(orient='values', date_format='iso', default_handler=str)
+
+
+def columns_json(df, **fields):
+    """
+    The DataFrame as a column-oriented JSON object: {"column_order": [...], "columns": {name: [values]}, **fields}.
+    Each column is encoded by pandas' C JSON encoder, timestamps as ISO 8601, and NaN/None as null.
+    """
+    columns = ', '.join(f'{json.dumps(str(col))}: {column_json(df[col])}' for col in df.columns)
+    head = json.dumps({'column_order': [str(col) for col in df.columns], **fields}, default=str)
+    return f'{head[:-1]}, "columns": {{{columns}}}}}'
+
+
+def arrow_ipc(df):
+    """The DataFrame as an Arrow IPC stream. Object columns are sent as text, with lists and dicts as JSON."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("format 'arrow' needs pyarrow: pip install paramount[arrow]")
+
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:  # Message histories and outputs vary in shape from row to row
+        df[col] = df[col].map(lambda v: v if isinstance(v, str) else json.dumps(v, default=str), na_action='ignore')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def compress_response(response, accept_encodings, min_size=1024):
+    """Compress a buffered response with brotli or gzip, when the client accepts it and it is worth it."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code >= 300 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if brotli is not None and accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,16 @@
+# Gunicorn hooks for `paramount` (see cli.start_gunicorn): gunicorn -c python:paramount.server.gunicorn_conf ...
+import sys
+
+
+def post_fork(server, worker):
+    # Under the gevent worker class, requests (replays) and waits on locks yield to other requests once gevent has
+    # patched the stdlib. psycopg2 talks to Postgres in C, and needs psycogreen's wait callback to do the same
+    ggevent = sys.modules.get('gunicorn.workers.ggevent')  # Only imported when it is the worker class
+    if ggevent is not None and isinstance(worker, ggevent.GeventWorker):
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen is not installed: Postgres queries will block the gevent worker "
+                               "(pip install paramount[async])")
+            return
+        patch_psycopg()
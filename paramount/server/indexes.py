@@ -0,0 +1,52 @@
+import threading
+import traceback
+
+DATA_TABLE = 'paramount_data'
+SESSIONS_TABLE = 'paramount_sessions'
+
+
+def paramount_indexes(config):
+    """
+    The indexes paramount maintains on its own tables, as {table_name: [index spec]}. A spec is a dict with the index
+    name, its columns as (column, 'ASC' | 'DESC') pairs in the order of the queries they serve, and an optional
+    partial index predicate. They mirror the /api/latest and /api/get_sessions queries: newest first with the
+    recording id as tie breaker, filtered on the identifier column when split_by_id is on.
+    """
+    api_config = config.get('api', {})
+    identifier_colname = api_config.get('identifier_colname')
+    recency = [('paramount__recorded_at', 'DESC'), ('paramount__recording_id', 'DESC')]
+    if api_config.get('split_by_id') and identifier_colname:
+        recency = [(identifier_colname, 'ASC')] + recency
+
+    return {
+        DATA_TABLE: [
+            {'name': f'{DATA_TABLE}_recent_idx', 'columns': recency, 'where': None},
+            # Only the evaluated rows, for evaluated_rows_only: matches the paramount__evaluation != '' filter
+            {'name': f'{DATA_TABLE}_evaluated_idx', 'columns': recency, 'where': "paramount__evaluation <> ''"},
+        ],
+        SESSIONS_TABLE: [
+            {'name': f'{SESSIONS_TABLE}_splitter_ts_idx',
+             'columns': [('paramount__session_splitter_id', 'ASC'), ('paramount__session_timestamp', 'DESC')],
+             'where': None},
+        ],
+    }
+
+
+def manage_indexes_enabled(config):
+    db_type = config['db']['type']
+    return bool((config['db'].get(db_type) or {}).get('manage_indexes', True))
+
+
+def ensure_indexes(db_instance, indexes):
+    for table_name, table_indexes in indexes.items():
+        try:
+            db_instance.ensure_indexes(table_name, table_indexes)
+        except Exception as e:  # Indexes are an optimization: never let them take the process down
+            print(f"PARAMOUNT: Could not create indexes on {table_name}: {e}: {traceback.format_exc()}")
+
+
+def ensure_indexes_in_background(db_instance, indexes):
+    """Create missing indexes on a daemon thread: builds on big tables can take minutes, and must not block startup."""
+    thread = threading.Thread(target=ensure_indexes, args=(db_instance, indexes), daemon=True)
+    thread.start()
+    return thread
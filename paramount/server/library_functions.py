@@ -1,6 +1,9 @@
 import uuid
 import toml
 import os
+import json
+import base64
+from datetime import datetime
 
 
 def load_config():
@@ -20,19 +23,88 @@ def default_config():
     default = {
         "record": {
             "enabled": True,
-            "function_url": "http://localhost:9000"
+            "function_url": "http://localhost:9000",
+            "queue_size": 10000,
+            "batch_size": 500,
+            "flush_interval": 1.0,
+            "backpressure": "drop",
+            "sample_rate": 1.0,
+            "max_recordings_per_second": 0,
+            "sample_rates": {},
+            "instrumentation": {
+                "enabled": False,
+                "sample_rate": 0.05,
+                "memory": False
+            },
+            "spool": {
+                "enabled": True,
+                "directory": "paramount_spool",
+                "segment_bytes": 16777216,
+                "fsync": True,
+                "retry_backoff": 1.0,
+                "max_backoff": 60.0,
+                "max_attempts": 0,
+                "shutdown_timeout": 5
+            }
         },
         "db": {
             "type": "csv",
             "postgres": {
-                "connection_string": ""
+                "connection_string": "",
+                "schema_cache_ttl": 5,
+                "ingest_method": "copy",
+                "manage_indexes": True,
+                "storage": "columns",
+                "pool_size": 5,
+                "max_overflow": 10,
+                "pool_timeout": 30,
+                "pool_pre_ping": True,
+                "pool_recycle": 1800,
+                "statement_timeout": 0,
+                "index_lock_timeout": 600
+            },
+            "sqlite": {
+                "path": "paramount.db",
+                "busy_timeout": 5000,
+                "manage_indexes": True
             }
         },
         "api": {
             "endpoint": "http://localhost",
             "port": 9001,
             "split_by_id": False,
-            "identifier_colname": ""
+            "identifier_colname": "",
+            "page_size": 100,
+            "max_page_size": 1000,
+            "similarity_metric": "tfidf_cosine",
+            "similarity_chunk_size": 10000,
+            "replay_concurrency": 16,
+            "replay_connect_timeout": 5,
+            "replay_timeout": 300,
+            "replay_retries": 2,
+            "replay_mode": "auto",
+            "compression": True,
+            "compression_min_size": 1024,
+            "replay_cache": {
+                "enabled": False,
+                "version": "",
+                "ttl_seconds": 86400,
+                "max_entries": 1024,
+                "persistent": True
+            },
+            "read_cache": {
+                "enabled": True,
+                "max_entries": 256,
+                "max_bytes": 33554432,
+                "ttl_seconds": 5
+            }
+        },
+        "server": {
+            "workers": 1,
+            "worker_class": "gthread",
+            "threads": 8,
+            "worker_connections": 1000,
+            "timeout": 0
         },
         "ui": {
             "meta_cols": [''],
@@ -59,6 +131,23 @@ def get_result_from_colname(result, output_col):
     return output_index, output_colname, data_item
 
 
+def encode_cursor(recorded_at, recording_id):
+    """Opaque pagination cursor for /api/latest, pointing at the last row of a page."""
+    # pandas Timestamps and datetimes both have isoformat(), strings are assumed to be ISO formatted already
+    recorded_at = recorded_at if isinstance(recorded_at, str) else recorded_at.isoformat()
+    payload = json.dumps([recorded_at, str(recording_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor: (recorded_at as a tz-aware datetime, recording_id)."""
+    try:
+        recorded_at, recording_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(recorded_at), recording_id
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError(f"Invalid pagination cursor: {cursor}")
+
+
 def is_valid_uuidv4(uuid_to_test):
     try:
         # Try converting string to UUID object
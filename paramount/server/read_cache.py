@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from time import time
+
+CachedResponse = namedtuple('CachedResponse', 'table_name generation expires_at etag body mimetype headers')
+
+
+class ReadCache:
+    """
+    In-process LRU cache of rendered /api/latest and /api/get_sessions responses, bounded by max_entries and
+    max_bytes, keyed by endpoint and request arguments.
+
+    Each entry remembers the generation of the table it was read from. Writes that go through this process
+    (submit_evaluations, and recordings or sessions delivered by its writer) call invalidate(), which bumps the
+    generation and drops the table's entries. Writes made by other processes (eg. a separately deployed app recording
+    with record()) are not seen: ttl_seconds bounds how stale a page can get.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, ttl_seconds=5):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._entries = OrderedDict()  # key -> CachedResponse
+        self._bytes = 0
+        self._generations = {}  # table_name -> int
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint, args):
+        canonical = json.dumps([endpoint, args or {}], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def generation(self, table_name):
+        """Read before querying the table, and passed to set(): a write during the query makes the entry stale."""
+        with self._lock:
+            return self._generations.get(table_name, 0)
+
+    def invalidate(self, table_name):
+        with self._lock:
+            self._generations[table_name] = self._generations.get(table_name, 0) + 1
+            self._stats['invalidations'] += 1
+            for key in [key for key, entry in self._entries.items() if entry.table_name == table_name]:
+                self._bytes -= len(self._entries.pop(key).body)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if (entry.generation == self._generations.get(entry.table_name, 0)
+                        and (entry.expires_at is None or entry.expires_at > time())):
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry
+                del self._entries[key]
+                self._bytes -= len(entry.body)
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, table_name, generation, body, mimetype, headers=None):
+        """Cache a response body (bytes). Returns the entry, with the ETag to send along."""
+        expires_at = time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        entry = CachedResponse(table_name, generation, expires_at, etag, body, mimetype, dict(headers or {}))
+        with self._lock:
+            if generation != self._generations.get(table_name, 0) or len(body) > self.max_bytes:
+                return entry  # Written to while it was read, or too big: served once, not cached
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key).body)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries), 'bytes': self._bytes}
+
+
+def read_cache_from_config(cache_config):
+    """Build the ReadCache described by the [api.read_cache] section, or None when it is disabled."""
+    if not cache_config.get('enabled', True):
+        return None
+    return ReadCache(max_entries=cache_config.get('max_entries', 256),
+                     max_bytes=cache_config.get('max_bytes', 32 * 1024 * 1024),
+                     ttl_seconds=cache_config.get('ttl_seconds', 5))
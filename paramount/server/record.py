@@ -1,15 +1,20 @@
-import pandas as pd
+import asyncio
 import json
 import inspect
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
+from functools import partial
 from time import time
 import uuid
 import traceback
 from flask import request, jsonify
 from paramount.server.db_connector import db
 from paramount.server.library_functions import load_config
-import threading
+from paramount.server.writer import get_writer
+from paramount.server.registry import register_function
+from paramount.server.sampling import Sampler
+from paramount.server.instrumentation import Instrumentation
+from paramount.server.indexes import DATA_TABLE, ensure_indexes_in_background, manage_indexes_enabled, paramount_indexes
+from paramount.server.streaming import StreamStats, is_stream, is_async_stream, iter_stream, tee_stream
 
 
 def is_jsonable(x):
@@ -40,33 +45,158 @@ def serialize_response(response):
     """Attempt to serialize response to a more JSON-friendly format."""
     if isinstance(response, tuple):
         return tuple(serialize_item(item) for item in response)  # Handle each tuple item.
-    elif callable(response):  # Check if it is a generator function, eg. LLM streaming is on (with SSE)
+    elif callable(response) or is_stream(response) or is_async_stream(response):  # Streaming: see tee_stream()
         return False
     else:
         return serialize_item(response)
 
 
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def snapshot(value):
+    """
+    Copy of the lists, tuples and dicts in value, down to their leaves. Rows are built on the writer thread, up to
+    flush_interval later, and the caller is free to mutate its arguments and results in the meantime (eg. append the
+    answer to the chat history it passed in): what gets recorded is taken on the caller's thread, right after the call.
+    Leaves are shared: strings and numbers are immutable.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {key: snapshot(item) for key, item in value.items()}
+    if value_type is list or value_type is tuple:
+        return value_type(snapshot(item) for item in value)
+    return value
+
+
+def snapshot_result(result):
+    """snapshot() of a result, whose other objects (eg. pydantic models) are serialized right away instead."""
+    def snapshot_item(item):
+        if type(item) in (dict, list, tuple) or isinstance(item, IMMUTABLE_TYPES):
+            return snapshot(item)
+        return serialize_item(item)
+
+    if type(result) is tuple:
+        return tuple(snapshot_item(item) for item in result)
+    return snapshot_item(result)
+
+
+def join_chunks(chunks):
+    """Reassemble streamed chunks into one output: text and bytes are concatenated, anything else is listed."""
+    if chunks and all(isinstance(chunk, str) for chunk in chunks):
+        return ''.join(chunks)
+    if chunks and all(isinstance(chunk, bytes) for chunk in chunks):
+        return b''.join(chunks).decode(errors='replace')
+    return [serialize_item(chunk) for chunk in chunks]
+
+
+async def collect_chunks(async_iterable):
+    return [chunk async for chunk in async_iterable]
+
+
+def call_function(func, func_kwargs):
+    """
+    Call func to completion from synchronous code, running coroutines and async generators on a new event loop.
+    Streaming results are consumed in full and reassembled into a single output.
+    """
+    if inspect.isasyncgenfunction(func):
+        return join_chunks(asyncio.run(collect_chunks(func(**func_kwargs)))),
+    result = func(**func_kwargs)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    if is_async_stream(result):
+        return join_chunks(asyncio.run(collect_chunks(result))),
+    if is_stream(result):
+        return join_chunks(list(iter_stream(result))),
+    return result
+
+
+def build_result_data(func_name, arg_names, args, kwargs, result, start_time, end_time, extra=None):
+    """
+    Build the recording row for one invocation. Runs on the writer thread, off the recorded function's path.
+    extra holds additional paramount__ columns, eg. streaming metrics or resource usage.
+    """
+    serialized_result = serialize_response(result)
+    if not serialized_result:
+        return None
+
+    # Recording timestamps are UTC, truncated to the second
+    timestamp_now = datetime.fromtimestamp(int(end_time), tz=timezone.utc)
+
+    # Update result data dictionary with invocation information
+    # CPU/MEM usage per invocation is opt-in, see [record.instrumentation] (passed in through extra)
+    # Skipped exception logging since functions may have internal handling: difficult to capture
+    result_data = {
+        'paramount__evaluation': "",
+        'paramount__recording_id': str(uuid.uuid4()),
+        'paramount__recorded_at': timestamp_now,
+        'paramount__evaluated_at': timestamp_now,
+        'paramount__function_name': func_name,
+        'paramount__execution_time': end_time - start_time}
+    if extra:
+        result_data.update(extra)
+
+    # Positional args are prefixed with 'args__' and keyword args with 'kwargs__'
+    # Then 'input_' is added as column name prefix, to differentiate from outputs
+    for key, value in zip(arg_names[:len(args)], args):
+        result_data['input_args__' + key] = value
+    for key, value in kwargs.items():
+        result_data['input_kwargs__' + key] = value
+
+    for i, output in enumerate(serialized_result, start=1):
+        if isinstance(output, dict):
+            for key, value in output.items():
+                result_data[f'output__{i}_{key}'] = value
+        else:
+            result_data[f'output__{i}'] = output
+    return result_data
+
+
+def build_stream_result_data(func_name, arg_names, args, kwargs, chunks, start_time, end_time, metrics):
+    """Recording row for a finished stream: the chunks are reassembled into the first (and only) output."""
+    return build_result_data(func_name, arg_names, args, kwargs, (join_chunks(chunks),), start_time, end_time,
+                             extra=metrics)
+
+
 def record(flask_app):
     config = load_config()
 
     db_type = config['db']['type']
 
     connection_string = ""
-    if db_type in config['db']:
-        db_config = config['db'].get(db_type)
-        if db_config and 'connection_string' in db_config:
-            connection_string = db_config['connection_string']
+    db_config = config['db'].get(db_type) or {}  # Backend specific settings, eg. [db.postgres]
+    if 'connection_string' in db_config:
+        connection_string = db_config['connection_string']
+
+    def open_database():
+        # Called by the writer on its first write: importing and connecting to the backend is kept off startup
+        db_instance = db.get_database(db_type, connection_string, db_config)
+        if manage_indexes_enabled(config):
+            ensure_indexes_in_background(db_instance, {DATA_TABLE: paramount_indexes(config)[DATA_TABLE]})
+        return db_instance
 
-    db_instance = db.get_database(db_type, connection_string)
+    # Shared with the paramount API when it runs in this process with the same database and config
+    writer = get_writer(open_database, config['record'], database=(db_type, connection_string))
 
     is_live = config['record']['enabled']
     print(f"Paramount enabled: {is_live}")
 
+    # Sampling is keyed by the identifier column (if any), so a given customer is sampled consistently
+    sampler = Sampler(config['record'], config.get('api', {}).get('identifier_colname'))
+    # CPU/MEM measurements for synchronous functions. Coroutines share their thread with every other task on the
+    # event loop, so per-invocation CPU time would be meaningless there and they are not instrumented
+    instrumentation = Instrumentation(config['record'].get('instrumentation', {}))
+
     def decorator(func):
         endpoint = f'/paramount_functions/{func.__name__}'
+        arg_names = list(inspect.signature(func).parameters.keys())  # Bound once, not on every invocation
+        should_record = sampler.for_function(func.__name__, arg_names)
+        register_function(func)  # Lets a paramount API running in this process replay it without the HTTP hop
 
         # Define the Flask view function.
-        @flask_app.route(endpoint, methods=['POST'])  # TODO: Password protect endpoint by default (+2FA?)
+        # TODO: Password protect endpoint by default (+2FA?)
+        # Unique endpoint name per function, otherwise Flask refuses to register a second decorated function
+        @flask_app.route(endpoint, methods=['POST'], endpoint=f'paramount_{func.__name__}')
         def view_func():
             # Here we grab the JSON data from the request
             data = request.json
@@ -77,8 +207,8 @@ def record(flask_app):
             additional_kwargs = data.get('kwargs', {})
             func_kwargs.update(additional_kwargs)
 
-            # Call the actual function with the provided keyword arguments.
-            result = func(**func_kwargs)
+            # Call the actual function with the provided keyword arguments (async functions run to completion here)
+            result = call_function(func, func_kwargs)
 
             # Serialize the result and return as JSON
             serialized_result = serialize_response(result)
@@ -87,71 +217,108 @@ def record(flask_app):
             else:
                 return jsonify({'Error': 'Streaming/SSE unsupported'}), 501  # SSE / streaming unsupported
 
+        def submit_stream(args, kwargs, start_time, submit, resource_metrics, chunks, end_time, metrics):
+            # Called when a stream finishes: like the metrics, execution_time covers the whole stream. args and kwargs
+            # are snapshots taken when the call returned, as the caller may change them while consuming the stream
+            try:
+                metrics.update(resource_metrics)
+                submit(partial(build_stream_result_data, func.__name__, arg_names, args, kwargs, chunks, start_time,
+                               end_time, metrics),
+                       'paramount_data', 'paramount__recording_id')
+            except Exception as e:
+                err_tcb = traceback.format_exc()
+                print(f"PARAMOUNT: Wrapper logic issue: {e}: {err_tcb}")
+
         def wrapper(*args, **kwargs):
-            if not is_live:
+            if not is_live or not should_record(args, kwargs):  # Unsampled calls skip all recording work
                 return func(*args, **kwargs)
             else:
+                probe = instrumentation.start()  # None unless instrumentation is on and samples this call
                 try:
-                    func_params = inspect.signature(func).parameters
-                    args_names = list(func_params.keys())
+                    start_time = time()
+                    result = func(*args, **kwargs)
+                    end_time = time()
+                except Exception as e:
+                    instrumentation.stop(probe)
+                    err_tcb = traceback.format_exc()
+                    print(f"PARAMOUNT: An error occurred while invoking {func.__name__}: {e}: {err_tcb}")
+                    raise  # Re-raise the exception for further handling if necessary
+                resource_metrics = instrumentation.stop(probe)
 
-                    # Create a dictionary for positional arguments with the prefix 'args_'
-                    prefixed_args = {'args__' + key: value for key, value in zip(args_names[:len(args)], args)}
+                try:
+                    if is_stream(result) or is_async_stream(result):
+                        # Forward the chunks untouched, and record the reassembled output once the stream finishes
+                        return tee_stream(result, start_time, partial(submit_stream, snapshot(args), snapshot(kwargs),
+                                                                      start_time, writer.submit, resource_metrics))
+                    if callable(result):
+                        return result  # Non-streamed response objects are forwarded as is
 
-                    # Create a dictionary for keyword arguments with the prefix 'kwargs_'
-                    prefixed_kwargs = {'kwargs__' + key: value for key, value in kwargs.items()}
+                    # Only a snapshot of the containers is taken here: binding, serialization and row building run on
+                    # the writer. Objects in the result (eg. pydantic models) are serialized now, as they may change
+                    writer.submit(partial(build_result_data, func.__name__, arg_names, snapshot(args),
+                                          snapshot(kwargs), snapshot_result(result), start_time, end_time,
+                                          resource_metrics),
+                                  'paramount_data', 'paramount__recording_id')
+                except Exception as e:
+                    err_tcb = traceback.format_exc()
+                    print(f"PARAMOUNT: Wrapper logic issue: {e}: {err_tcb}")
 
-                    # Merge the two dictionaries
-                    args_dict = {**prefixed_args, **prefixed_kwargs}
+                return result
 
+        async def async_wrapper(*args, **kwargs):
+            if not is_live or not should_record(args, kwargs):
+                return await func(*args, **kwargs)
+            else:
+                try:
                     start_time = time()
-                    result = func(*args, **kwargs)
+                    result = await func(*args, **kwargs)
                     end_time = time()
                 except Exception as e:
                     err_tcb = traceback.format_exc()
                     print(f"PARAMOUNT: An error occurred while invoking {func.__name__}: {e}: {err_tcb}")
-                    raise  # Re-raise the exception for further handling if necessary
+                    raise
 
                 try:
-                    serialized_result = serialize_response(result)
-
-                    if not serialized_result:
-                        # to support SSE/streaming, can intercept here and pick out metadata / answer upon finish
-                        return result  # SSE / streaming unsupported, forwarding the raw streamer
-
-                    # Get current UTC timestamp
-                    timestamp_now = datetime.now(pytz.timezone('UTC')).replace(microsecond=0).isoformat()
-
-                    # Update result data dictionary with invocation information
-                    # TODO: In future, could measure CPU/MEM usage per invocation. Skipped for now to not add overhead
-                    # Skipped exception logging since functions may have internal handling: difficult to capture
-                    result_data = {
-                        'paramount__evaluation': "",
-                        'paramount__recording_id': str(uuid.uuid4()),
-                        'paramount__recorded_at': timestamp_now,
-                        'paramount__evaluated_at': timestamp_now,
-                        'paramount__function_name': func.__name__,
-                        'paramount__execution_time': end_time - start_time,
-                        **{f'input_{k}': v for k, v in args_dict.items()}}  # prefix for column name: to differentiate
-                    for i, output in enumerate(serialized_result, start=1):
-                        if isinstance(output, dict):
-                            for key, value in output.items():
-                                result_data[f'output__{i}_{key}'] = value
-                        else:
-                            result_data[f'output__{i}'] = output
-                    df = pd.DataFrame([result_data])
-                    df['paramount__recorded_at'] = pd.to_datetime(df['paramount__recorded_at'])
-                    df['paramount__evaluated_at'] = pd.to_datetime(df['paramount__evaluated_at'])
-
-                    # Fire and forget for this heavy operation
-                    threading.Thread(target=db_instance.create_or_append,
-                                     args=(df, 'paramount_data', 'paramount__recording_id'), daemon=True).start()
-
+                    if is_stream(result) or is_async_stream(result):
+                        return tee_stream(result, start_time, partial(submit_stream, snapshot(args), snapshot(kwargs),
+                                                                      start_time, writer.submit_nonblocking, {}))
+                    if not callable(result):
+                        writer.submit_nonblocking(partial(build_result_data, func.__name__, arg_names, snapshot(args),
+                                                          snapshot(kwargs), snapshot_result(result),
+                                                          start_time, end_time),
+                                                  'paramount_data', 'paramount__recording_id')
                 except Exception as e:
                     err_tcb = traceback.format_exc()
                     print(f"PARAMOUNT: Wrapper logic issue: {e}: {err_tcb}")
 
                 return result
 
+        async def async_gen_wrapper(*args, **kwargs):
+            if not is_live or not should_record(args, kwargs):
+                async for chunk in func(*args, **kwargs):
+                    yield chunk
+                return
+
+            start_time = time()
+            stats = StreamStats(start_time)
+            recorded_args, recorded_kwargs = snapshot(args), snapshot(kwargs)  # Before the body can change them
+            try:
+                async for chunk in func(*args, **kwargs):
+                    stats.add(chunk)
+                    yield chunk
+            except Exception as e:
+                err_tcb = traceback.format_exc()
+                print(f"PARAMOUNT: An error occurred while invoking {func.__name__}: {e}: {err_tcb}")
+                raise
+            end_time = time()
+
+            # Recorded once the stream is exhausted, with the chunks reassembled into a single output
+            submit_stream(recorded_args, recorded_kwargs, start_time, writer.submit_nonblocking, {}, stats.chunks,
+                          end_time, stats.metrics(end_time))
+
+        if inspect.isasyncgenfunction(func):
+            return async_gen_wrapper
+        if inspect.iscoroutinefunction(func):
+            return async_wrapper
         return wrapper
     return decorator
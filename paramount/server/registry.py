@@ -0,0 +1,18 @@
+import threading
+
+# Functions decorated with record() in this process, by name, as they were before decoration
+_functions = {}
+_lock = threading.Lock()
+
+
+def register_function(func):
+    with _lock:
+        _functions[func.__name__] = func
+
+
+def get_function(func_name):
+    return _functions.get(func_name)
+
+
+def registered_functions():
+    return sorted(_functions.keys())
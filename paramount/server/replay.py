@@ -0,0 +1,96 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from paramount.server.registry import get_function
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def make_session(pool_size=16, retries=2, backoff_factor=0.5):
+    """
+    A requests.Session with a keep-alive connection pool sized for pool_size concurrent replays. Connection errors
+    and 502/503/504 answers are retried with exponential backoff (POST included: replays are re-runs by nature).
+    """
+    retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(502, 503, 504), allowed_methods=frozenset(['POST']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(api_config=None):
+    """The process-wide replay session, configured from the [api] section on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                api_config = api_config or {}
+                _session = make_session(pool_size=api_config.get('replay_concurrency', 16),
+                                        retries=api_config.get('replay_retries', 2),
+                                        backoff_factor=api_config.get('replay_backoff', 0.5))
+    return _session
+
+
+def invoke_via_functions_api(func_name, base_url, args=None, kwargs=None, session=None, timeout=None):
+    # construct the endpoint based on the function name
+    endpoint = f'{base_url}/paramount_functions/{func_name}'
+    data_payload = {}
+    if args is not None:
+        data_payload['args'] = args
+    if kwargs is not None:
+        data_payload['kwargs'] = kwargs
+    session = session or get_session()
+    try:
+        # Send the POST request to the endpoint with JSON payload, over a pooled keep-alive connection
+        response = session.post(endpoint, json=data_payload, timeout=timeout)
+
+        # Check if the request was successful
+        if response.status_code == 200:
+            # Handle successful response
+            response = response.json()
+        else:
+            # Handle errors
+            err = (response.status_code, response.text)
+            print("Error:", err)
+            response = err
+    except requests.exceptions.RequestException as e:
+        # Handle request exceptions (e.g., connection errors)
+        print("Request failed:", e)
+        response = e
+
+    return response
+
+
+def invoke_locally(func_name, args=None, kwargs=None):
+    """
+    Call a function registered by record() in this process directly: no network, no JSON round-trip and no Flask
+    dispatch. The result has the same shape as over HTTP (tuples become lists), and dicts are shallow copies, so
+    callers can add test_ entries without touching objects the function still holds on to.
+    """
+    # Imported here, as record imports flask and the registry is only filled once record() has run anyway
+    from paramount.server.record import call_function, serialize_response
+
+    func = get_function(func_name)
+    if func is None:
+        raise LookupError(f"Function {func_name} is not registered in this process")
+    func_kwargs = {**(args or {}), **(kwargs or {})}
+    result = serialize_response(call_function(func, func_kwargs))
+    if isinstance(result, (tuple, list)):
+        return [dict(item) if isinstance(item, dict) else item for item in result]
+    if isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+def invoke(func_name, base_url, args=None, kwargs=None, mode='auto', session=None, timeout=None):
+    """
+    Replay a function. mode 'local' calls it in-process (see invoke_locally), 'http' goes through
+    base_url/paramount_functions/<name>, and 'auto' calls it in-process when it is registered here, else over HTTP.
+    """
+    if mode == 'local' or (mode == 'auto' and get_function(func_name) is not None):
+        return invoke_locally(func_name, args, kwargs)
+    return invoke_via_functions_api(func_name, base_url, args=args, kwargs=kwargs, session=session, timeout=timeout)
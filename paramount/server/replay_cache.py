@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+from time import time
+
+
+def cache_key(func_name, args, kwargs, version):
+    """Content address of a replay: the function, its canonicalized arguments and the code/version tag."""
+    canonical = json.dumps([func_name, args or {}, kwargs or {}, version or ''], sort_keys=True,
+                           separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ReplayCache:
+    """
+    Two-tier cache of replay results, keyed by cache_key().
+
+    The memory tier is an LRU bounded by max_entries and max_bytes (of JSON), living in this process. The optional
+    persistent tier is a table in the configured db_connector backend, shared between processes and restarts, and
+    pruned down to max_persistent_entries every prune_every writes. Entries in both tiers expire after ttl_seconds
+    (0: never). Results are stored as JSON text, so each hit hands out a fresh copy.
+    """
+
+    def __init__(self, db_instance=None, table_name='paramount_replay_cache', max_entries=1024,
+                 max_bytes=64 * 1024 * 1024, ttl_seconds=86400, max_persistent_entries=100000, prune_every=100):
+        self.db_instance = db_instance
+        self.table_name = table_name
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_persistent_entries = int(max_persistent_entries)
+        self.prune_every = int(prune_every)
+
+        self._entries = OrderedDict()  # key -> (expires_at or None, result json)
+        self._bytes = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _expires_at(self):
+        return time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+
+    def _remember(self, key, result_json, expires_at):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)[1])
+            self._entries[key] = (expires_at, result_json)
+            self._bytes += len(result_json)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_json) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted_json)
+
+    def get(self, key):
+        """Returns (result, tier) with tier 'memory' or 'persistent', or (None, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result_json = entry
+                if expires_at is None or expires_at > time():
+                    self._entries.move_to_end(key)
+                    return json.loads(result_json), 'memory'
+                del self._entries[key]
+                self._bytes -= len(result_json)
+
+        if self.db_instance is not None:
+            try:
+                result_json = self.db_instance.get_cached_replay(self.table_name, key)
+            except Exception as e:  # The cache must never break a replay: treat errors as a miss
+                print(f"PARAMOUNT: Replay cache lookup failed: {e}: {traceback.format_exc()}")
+                result_json = None
+            if result_json is not None:
+                self._remember(key, result_json, self._expires_at())
+                return json.loads(result_json), 'persistent'
+        return None, None
+
+    def set(self, key, func_name, result):
+        result_json = json.dumps(result, default=str)
+        expires_at = self._expires_at()
+        self._remember(key, result_json, expires_at)
+
+        if self.db_instance is not None:
+            try:
+                expires_at_dt = datetime.fromtimestamp(expires_at, tz=timezone.utc) if expires_at else None
+                self.db_instance.set_cached_replay(self.table_name, key, func_name, result_json, expires_at_dt)
+                with self._lock:
+                    self._writes += 1
+                    prune = self._writes % self.prune_every == 0
+                if prune:
+                    self.db_instance.prune_cached_replays(self.table_name, self.max_persistent_entries)
+            except Exception as e:
+                print(f"PARAMOUNT: Replay cache write failed: {e}: {traceback.format_exc()}")
+
+
+def replay_cache_from_config(cache_config, db_instance):
+    """Build the ReplayCache described by the [api.replay_cache] section, or None when it is disabled."""
+    if not cache_config.get('enabled', False):
+        return None
+    return ReplayCache(db_instance=db_instance if cache_config.get('persistent', True) else None,
+                       max_entries=cache_config.get('max_entries', 1024),
+                       max_bytes=cache_config.get('max_bytes', 64 * 1024 * 1024),
+                       ttl_seconds=cache_config.get('ttl_seconds', 86400),
+                       max_persistent_entries=cache_config.get('max_persistent_entries', 100000))
@@ -0,0 +1,81 @@
+import random
+import threading
+import zlib
+from time import monotonic
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing on average `rate` acquisitions per second, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def keyed_fraction(value):
+    """Map a value to a stable number in [0, 1), the same in every process (unlike hash(), which is salted)."""
+    return zlib.crc32(str(value).encode()) / 2 ** 32
+
+
+class Sampler:
+    """
+    Decides, before a recorded function runs, whether its invocation gets recorded at all.
+
+    Each function has a sample rate (the per-function rate from [record.sample_rates], else the global
+    [record] sample_rate). When the configured identifier column maps to one of the function's arguments, the
+    decision is keyed on that argument's value, so a given customer is either always or never sampled; otherwise
+    it is random. On top, an optional process-wide token bucket caps recordings per second.
+    """
+
+    def __init__(self, record_config, identifier_colname=None):
+        self.default_rate = float(record_config.get('sample_rate', 1.0))
+        self.function_rates = {name: float(rate) for name, rate in record_config.get('sample_rates', {}).items()}
+        max_per_second = record_config.get('max_recordings_per_second', 0)
+        self.bucket = TokenBucket(max_per_second, record_config.get('max_recordings_burst')) \
+            if max_per_second else None
+
+        # Column names look like input_args__company_uuid or input_kwargs__company_uuid: keep the argument name
+        self.identifier_arg = None
+        if identifier_colname:
+            for prefix in ('input_args__', 'input_kwargs__'):
+                if identifier_colname.startswith(prefix):
+                    self.identifier_arg = identifier_colname[len(prefix):]
+
+    def for_function(self, func_name, arg_names):
+        """Return a should_record(args, kwargs) callable for one function, with its lookups resolved up front."""
+        rate = self.function_rates.get(func_name, self.default_rate)
+        bucket = self.bucket
+        identifier_arg = self.identifier_arg if self.identifier_arg in arg_names else None
+        identifier_index = arg_names.index(identifier_arg) if identifier_arg else None
+
+        def should_record(args, kwargs):
+            if rate < 1:
+                if rate <= 0:
+                    return False
+                if identifier_arg is not None:
+                    if identifier_arg in kwargs:
+                        fraction = keyed_fraction(kwargs[identifier_arg])
+                    elif identifier_index < len(args):
+                        fraction = keyed_fraction(args[identifier_index])
+                    else:
+                        fraction = random.random()
+                else:
+                    fraction = random.random()
+                if fraction >= rate:
+                    return False
+            return bucket is None or bucket.try_acquire()
+
+        return should_record
@@ -0,0 +1,78 @@
+import numpy as np
+
+# scikit-learn is imported by the metrics that use it, on the first /api/similarity request: it is slow to import
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def rowwise_cosine(matrix_a, matrix_b):
+    """Cosine similarity between row i of matrix_a and row i of matrix_b, for every i, in one sparse pass."""
+    from sklearn.preprocessing import normalize
+    products = normalize(matrix_a).multiply(normalize(matrix_b))
+    return np.asarray(products.sum(axis=1)).ravel()
+
+
+def chunks(n_rows, chunk_size):
+    for start in range(0, n_rows, chunk_size):
+        yield start, min(start + chunk_size, n_rows)
+
+
+def vectorized_cosine(vectorizer, ground_truth, test_set, chunk_size):
+    # The vocabulary (and idf weights) come from the ground truth, as the test outputs are compared against it
+    vectorizer.fit(ground_truth)
+    scores = np.empty(len(ground_truth))
+    for start, end in chunks(len(ground_truth), chunk_size):  # Bounded memory: one chunk of vectors at a time
+        scores[start:end] = rowwise_cosine(vectorizer.transform(ground_truth[start:end]),
+                                           vectorizer.transform(test_set[start:end]))
+    return scores
+
+
+def tfidf_cosine(ground_truth, test_set, chunk_size=DEFAULT_CHUNK_SIZE):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return vectorized_cosine(TfidfVectorizer(), ground_truth, test_set, chunk_size)
+
+
+def char_ngram_cosine(ground_truth, test_set, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Character n-grams within word boundaries: robust to typos, inflections and small rewordings
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return vectorized_cosine(TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4)), ground_truth, test_set,
+                             chunk_size)
+
+
+def token_jaccard(ground_truth, test_set, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Binary token presence: intersection is the row-wise product, union is |A| + |B| - intersection
+    # Hashed features need no fitted vocabulary, so each chunk is processed independently
+    from sklearn.feature_extraction.text import HashingVectorizer
+    vectorizer = HashingVectorizer(token_pattern=r"(?u)\b\w+\b", binary=True, norm=None, alternate_sign=False)
+    scores = np.empty(len(ground_truth))
+    for start, end in chunks(len(ground_truth), chunk_size):
+        tokens_a = vectorizer.transform(ground_truth[start:end])
+        tokens_b = vectorizer.transform(test_set[start:end])
+        intersection = np.asarray(tokens_a.multiply(tokens_b).sum(axis=1)).ravel()
+        union = np.asarray(tokens_a.sum(axis=1)).ravel() + np.asarray(tokens_b.sum(axis=1)).ravel() - intersection
+        # Two outputs without any tokens are considered identical
+        scores[start:end] = np.divide(intersection, union, out=np.ones(len(union)), where=union > 0)
+    return scores
+
+
+def exact_match(ground_truth, test_set, chunk_size=DEFAULT_CHUNK_SIZE):
+    return (np.asarray(ground_truth, dtype=object) == np.asarray(test_set, dtype=object)).astype(float)
+
+
+METRICS = {
+    'tfidf_cosine': tfidf_cosine,
+    'char_ngram': char_ngram_cosine,
+    'token_jaccard': token_jaccard,
+    'exact_match': exact_match,
+}
+
+
+def compute_similarity(ground_truth, test_set, metric='tfidf_cosine', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Row-wise similarity scores (a list of floats in [0, 1]) between two equally long lists of strings."""
+    if metric not in METRICS:
+        raise ValueError(f"Unsupported similarity metric: {metric} (should be one of {list(METRICS.keys())})")
+    if len(ground_truth) != len(test_set):
+        raise ValueError('Ground truth and test set must have the same number of rows')
+    if len(ground_truth) == 0:
+        return []
+    return METRICS[metric](list(ground_truth), list(test_set), chunk_size=max(1, int(chunk_size))).tolist()
@@ -0,0 +1,292 @@
+import itertools
+import os
+import pickle
+import random
+import struct
+import threading
+import time
+import traceback
+import zlib
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process per spool directory
+    fcntl = None
+
+# A frame is one batch of rows for one table: header, then the pickled (table_name, primary_key, rows)
+FRAME_HEADER = struct.Struct('<IIdI')  # Payload length, crc32 of the payload, time.time() when spooled, row count
+SEGMENT_SUFFIX = '.seg'
+POSITION_FILE = 'position'  # "<segment number> <offset>" of the first frame not delivered yet
+FAILED_FILE = 'failed.frames'  # Frames given up on: permanent errors, or max_attempts failed deliveries
+# DB-API (PEP 249) error classes, also used by SQLAlchemy's wrappers, for errors in the rows or the statement itself
+PERMANENT_ERRORS = ('DataError', 'IntegrityError', 'ProgrammingError', 'NotSupportedError')
+
+
+def segment_name(number):
+    return f'{number:012d}{SEGMENT_SUFFIX}'
+
+
+def is_permanent(error):
+    """
+    Whether the database rejected the batch itself, so that delivering it again can't succeed (unlike eg. when the
+    database is unreachable). Other errors, including bugs on paramount's side, are retried.
+    """
+    return any(cls.__name__ in PERMANENT_ERRORS for cls in type(error).__mro__)
+
+
+def read_frames(path, start=0):
+    """(offset, header fields, payload) of each intact frame of a segment file, stopping at the first torn one."""
+    with open(path, 'rb') as segment:
+        segment.seek(start)
+        offset = start
+        while True:
+            header = segment.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            length, crc, spooled_at, rows = FRAME_HEADER.unpack(header)
+            payload = segment.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield offset, (length, crc, spooled_at, rows), payload
+            offset += FRAME_HEADER.size + length
+
+
+def read_position(directory):
+    try:
+        with open(os.path.join(directory, POSITION_FILE)) as position_file:
+            number, offset = position_file.read().split()
+            return int(number), int(offset)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_segments(directory):
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                  if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+
+def pending_frames(directory):
+    """(segment number, offset, frame size, spooled_at, rows) of the frames of a spool directory not delivered yet."""
+    position = read_position(directory)
+    pending = []
+    for number in list_segments(directory):
+        if position is not None and number < position[0]:
+            continue
+        start = position[1] if position is not None and number == position[0] else 0
+        pending += [(number, offset, FRAME_HEADER.size + header[0], header[2], header[3])
+                    for offset, header, _ in read_frames(os.path.join(directory, segment_name(number)), start)]
+    return pending
+
+
+def inspect_spool(root):
+    """Depth and age of each process' spool under root, read from disk: for `paramount spool` and alerting."""
+    if not os.path.isdir(root):
+        return []
+    report = []
+    for slot in sorted(os.listdir(root)):
+        directory = os.path.join(root, slot)
+        if not os.path.isdir(directory):
+            continue
+        pending = pending_frames(directory)
+        report.append({'directory': directory,
+                       'pending_batches': len(pending),
+                       'pending_rows': sum(frame[4] for frame in pending),
+                       'pending_bytes': sum(frame[2] for frame in pending),
+                       'oldest_age_seconds': time.time() - pending[0][3] if pending else 0.0,
+                       'failed_bytes': os.path.getsize(os.path.join(directory, FAILED_FILE))
+                       if os.path.exists(os.path.join(directory, FAILED_FILE)) else 0})
+    return report
+
+
+def claim_directory(root):
+    """
+    A spool directory of its own for this process: the first root/<n> that no other live process holds a lock on.
+    Restarted processes take over the directories (and undelivered rows) of the processes they replace.
+    """
+    for slot in itertools.count():
+        directory = os.path.join(root, str(slot))
+        os.makedirs(directory, exist_ok=True)
+        lock_file = open(os.path.join(directory, 'lock'), 'a+b')
+        if fcntl is None:
+            return directory, lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return directory, lock_file
+        except BlockingIOError:
+            lock_file.close()
+
+
+class Spool:
+    """
+    Append-only, on-disk buffer between the recording writer and the database. Batches of rows are appended to
+    segment files (fsynced once per batch) and a drainer thread delivers them, oldest first, retrying failed
+    deliveries with exponential backoff. Batches that can't be delivered as they are (see is_permanent), or still
+    fail after max_attempts, are moved to failed.frames. Rows spooled by a previous run are delivered on startup.
+
+    The position of the first undelivered batch is persisted after every delivery, so a crash re-delivers at most
+    the batch in flight. Fully delivered segments are deleted.
+    """
+
+    def __init__(self, deliver, directory='paramount_spool', segment_bytes=16 * 1024 * 1024, fsync=True,
+                 retry_backoff=1.0, max_backoff=60.0, max_attempts=0):
+        self.deliver = deliver  # deliver(table_name, primary_key, rows), raises when the rows were not written
+        self.directory, self._lock_file = claim_directory(directory)
+        self.segment_bytes = int(segment_bytes)
+        self.fsync = bool(fsync)
+        self.retry_backoff = float(retry_backoff)
+        self.max_backoff = float(max_backoff)
+        self.max_attempts = int(max_attempts)  # 0 retries forever
+
+        self._cond = threading.Condition()
+        self._pending = deque()  # (segment number, offset, frame size, spooled_at, rows) of undelivered frames
+        self._active = None  # (segment number, file) frames are appended to
+        self._thread = None
+        self._deadline = None  # Set by flush(): the drainer stops once empty, or at this monotonic() time
+        self._stats = {'spooled_rows': 0, 'delivered_rows': 0, 'retries': 0, 'failed_batches': 0, 'last_error': None}
+        self._recover()
+        if self._pending:
+            print(f"PARAMOUNT: Delivering {len(self._pending)} spooled batches from {self.directory}")
+            self.start()
+
+    def _recover(self):
+        position = read_position(self.directory)
+        segments = list_segments(self.directory)
+        active = None
+        for number in segments:
+            path = os.path.join(self.directory, segment_name(number))
+            if position is not None and number < position[0]:
+                os.remove(path)  # Delivered, the process stopped before deleting it
+                continue
+            frames = list(read_frames(path))
+            end = frames[-1][0] + FRAME_HEADER.size + frames[-1][1][0] if frames else 0
+            if end < os.path.getsize(path):  # A batch torn by a crash mid-append: never acknowledged, drop it
+                with open(path, 'r+b') as segment:
+                    segment.truncate(end)
+            start = position[1] if position is not None and number == position[0] else 0
+            pending = [(number, offset, FRAME_HEADER.size + header[0], header[2], header[3])
+                       for offset, header, _ in frames if offset >= start]
+            if not pending and (end or start or number != segments[-1]):
+                os.remove(path)  # Delivered, or empty and not appended to: nothing to keep it for
+                continue
+            self._pending.extend(pending)
+            active = number
+        # Frames are appended to the last segment still holding undelivered ones (or left empty, eg. by a run that
+        # spooled nothing), otherwise to a new one: restarts don't leave empty segments behind
+        number = active if active is not None else max(segments + [position[0] if position is not None else -1]) + 1
+        self._active = (number, open(os.path.join(self.directory, segment_name(number)), 'ab'))
+
+    def append(self, table_name, primary_key, rows):
+        payload = pickle.dumps((table_name, primary_key, rows), protocol=pickle.HIGHEST_PROTOCOL)
+        spooled_at = time.time()
+        frame = FRAME_HEADER.pack(len(payload), zlib.crc32(payload), spooled_at, len(rows)) + payload
+        with self._cond:
+            number, segment = self._active
+            if segment.tell() and segment.tell() + len(frame) > self.segment_bytes:
+                segment.close()
+                number += 1
+                segment = open(os.path.join(self.directory, segment_name(number)), 'ab')
+                self._active = (number, segment)
+            offset = segment.tell()
+            segment.write(frame)
+            segment.flush()
+            if self.fsync:
+                os.fsync(segment.fileno())
+            self._pending.append((number, offset, len(frame), spooled_at, len(rows)))
+            self._stats['spooled_rows'] += len(rows)
+            self._cond.notify_all()
+        self.start()
+
+    def start(self):
+        with self._cond:
+            self._deadline = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._drain, name='paramount-spool', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout=None):
+        """Deliver what is spooled, for at most timeout seconds, then stop the drainer: the rest stays on disk."""
+        with self._cond:
+            self._deadline = time.monotonic() + timeout if timeout is not None else float('inf')
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _stopping(self):
+        return self._deadline is not None and (not self._pending or time.monotonic() >= self._deadline)
+
+    def _drain(self):
+        attempts = 0
+        while True:
+            with self._cond:
+                while not self._pending and self._deadline is None:
+                    self._cond.wait()
+                if self._stopping():
+                    return
+                number, offset, size, spooled_at, rows = self._pending[0]
+
+            path = os.path.join(self.directory, segment_name(number))
+            _, header, payload = next(read_frames(path, offset))
+            table_name, primary_key, batch = pickle.loads(payload)
+            try:
+                self.deliver(table_name, primary_key, batch)
+            except Exception as e:
+                attempts += 1
+                with self._cond:
+                    self._stats['retries'] += 1
+                    self._stats['last_error'] = f"{type(e).__name__}: {e}"
+                if not is_permanent(e) and (not self.max_attempts or attempts < self.max_attempts):
+                    delay = min(self.max_backoff, self.retry_backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+                    print(f"PARAMOUNT: Could not deliver {rows} spooled rows to {table_name} (attempt {attempts}), "
+                          f"retrying in {delay:.1f}s: {e}")
+                    with self._cond:
+                        if self._deadline is not None:
+                            delay = min(delay, max(0.0, self._deadline - time.monotonic()))
+                        self._cond.wait(delay)
+                    continue
+                err_tcb = traceback.format_exc()
+                print(f"PARAMOUNT: Giving up on {rows} spooled rows for {table_name} after {attempts} attempts, "
+                      f"kept in {os.path.join(self.directory, FAILED_FILE)}: {e}: {err_tcb}")
+                with open(os.path.join(self.directory, FAILED_FILE), 'ab') as failed:
+                    failed.write(FRAME_HEADER.pack(*header) + payload)
+                with self._cond:
+                    self._stats['failed_batches'] += 1
+            else:
+                with self._cond:
+                    self._stats['delivered_rows'] += rows
+            attempts = 0
+            self._advance(number, offset + size)
+
+    def _advance(self, number, offset):
+        """Persist the position after a delivered (or given up) frame, deleting the segments left behind."""
+        with self._cond:
+            self._pending.popleft()
+            if self._pending:
+                number, offset = self._pending[0][:2]
+            active_number = self._active[0]
+        tmp_path = os.path.join(self.directory, POSITION_FILE + '.tmp')
+        with open(tmp_path, 'w') as position_file:
+            position_file.write(f'{number} {offset}')
+            position_file.flush()
+            if self.fsync:
+                os.fsync(position_file.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, POSITION_FILE))
+        for old in list_segments(self.directory):
+            if old < number and old < active_number:
+                os.remove(os.path.join(self.directory, segment_name(old)))
+
+    def close(self):
+        """Close the files of a spool that is not draining, eg. the parent's spool in a forked child."""
+        self._active[1].close()
+        self._lock_file.close()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending_batches'] = len(self._pending)
+            stats['pending_rows'] = sum(frame[4] for frame in self._pending)
+            stats['pending_bytes'] = sum(frame[2] for frame in self._pending)
+            stats['oldest_age_seconds'] = time.time() - self._pending[0][3] if self._pending else 0.0
+        stats['directory'] = self.directory
+        return stats
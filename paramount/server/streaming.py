@@ -0,0 +1,121 @@
+from collections.abc import AsyncIterator, Iterator
+from time import time
+
+
+def is_stream(result):
+    """Generators and other iterators, plus streamed Flask/werkzeug responses (eg. LLM streaming with SSE)."""
+    if getattr(result, 'is_streamed', False) and hasattr(result, 'response'):
+        return True
+    return isinstance(result, Iterator) and not isinstance(result, (str, bytes, dict))
+
+
+def is_async_stream(result):
+    return isinstance(result, AsyncIterator)
+
+
+class StreamStats:
+    """Collects the chunks of one stream along with its timing, relative to when the function was called."""
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.first_chunk_time = None
+        self.chunks = []
+
+    def add(self, chunk):
+        if self.first_chunk_time is None:
+            self.first_chunk_time = time()
+        self.chunks.append(chunk)
+
+    def metrics(self, end_time):
+        first_chunk_time = self.first_chunk_time if self.first_chunk_time is not None else end_time
+        return {
+            'paramount__time_to_first_chunk': first_chunk_time - self.start_time,
+            'paramount__stream_duration': end_time - self.start_time,
+            'paramount__chunk_count': len(self.chunks)}
+
+
+class RecordingStream:
+    """
+    Pass-through tee over a synchronous stream: every chunk is forwarded as soon as it is produced, and on_finish
+    is called with (chunks, end_time, metrics) once the stream is exhausted. Streams closed early (eg. the client
+    went away) are not reported, since a partial answer would make a misleading recording.
+    """
+
+    def __init__(self, iterable, start_time, on_finish):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._stats = StreamStats(start_time)
+        self._on_finish = on_finish
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self._finish()
+            raise
+        self._stats.add(chunk)
+        return chunk
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            end_time = time()
+            self._on_finish(self._stats.chunks, end_time, self._stats.metrics(end_time))
+
+    def close(self):
+        # werkzeug calls close() on response iterables once it is done with them: forward it to the source
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+class AsyncRecordingStream:
+    """Asynchronous counterpart of RecordingStream, for async iterators returned by recorded functions."""
+
+    def __init__(self, async_iterable, start_time, on_finish):
+        self._async_iterable = async_iterable
+        self._async_iterator = async_iterable.__aiter__()
+        self._stats = StreamStats(start_time)
+        self._on_finish = on_finish
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._async_iterator.__anext__()
+        except StopAsyncIteration:
+            if not self._finished:
+                self._finished = True
+                end_time = time()
+                self._on_finish(self._stats.chunks, end_time, self._stats.metrics(end_time))
+            raise
+        self._stats.add(chunk)
+        return chunk
+
+    async def aclose(self):
+        aclose = getattr(self._async_iterable, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+def tee_stream(result, start_time, on_finish):
+    """Wrap a streaming result so that it is recorded when it finishes. Streamed responses are wrapped in place."""
+    if is_async_stream(result):
+        return AsyncRecordingStream(result, start_time, on_finish)
+    if getattr(result, 'is_streamed', False) and hasattr(result, 'response'):
+        result.response = RecordingStream(result.response, start_time, on_finish)
+        return result
+    return RecordingStream(result, start_time, on_finish)
+
+
+def iter_stream(result):
+    """The chunks of a streaming result, for consuming it in full (eg. when replaying)."""
+    if getattr(result, 'is_streamed', False) and hasattr(result, 'response'):
+        return result.response
+    return result
@@ -0,0 +1,308 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import traceback
+import atexit
+from time import monotonic
+from paramount.server.spool import Spool
+
+BACKPRESSURE_POLICIES = ('drop', 'block', 'sample')
+
+
+class RecordingWriter:
+    """
+    Process-wide recording pipeline: a bounded queue drained by a single background thread, which coalesces
+    the queued rows into multi-row batches per table and flushes them when batch_size is reached or when
+    flush_interval seconds have passed since the oldest pending row, whichever comes first.
+
+    When the queue is full, the backpressure policy decides what happens to a new row:
+    - drop: discard the row
+    - block: wait (at most block_timeout seconds, or forever if None) for room in the queue
+    - sample: start shedding load once the queue is half full, admitting rows with a probability that decreases
+      linearly with the remaining capacity, and drop everything once it is full
+
+    With a spool (see paramount.server.spool), batches go to disk first and the spool delivers them to the database,
+    retrying through outages. Without one, or when spooling fails, they are written to the database directly.
+    """
+
+    def __init__(self, db_instance, queue_size=10000, batch_size=500, flush_interval=1.0, backpressure='drop',
+                 block_timeout=None, spool_options=None):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unsupported backpressure policy: {backpressure} (should be one of "
+                             f"{BACKPRESSURE_POLICIES})")
+        # A Database, or a zero-argument callable opening one on the first write: then a process that records
+        # nothing never imports its backend (nor pandas), see record()
+        self._db_instance = db_instance
+        self._db_lock = threading.Lock()
+        self.queue_size = int(queue_size)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'skipped': 0, 'batches': 0,
+                       'spooled': 0}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.write_listeners = []  # Called with the table name after rows were written, eg. to invalidate caches
+
+        # Opened on the first write (by the writer thread): processes that record nothing, eg. with record.enabled
+        # = false, don't claim a spool directory. Rows left by a previous run are delivered from then on
+        self.spool_options = spool_options
+        self.spool = None
+        self._spool_opened = False
+
+    def _open_spool(self):
+        if self.spool_options is None:
+            return None
+        try:
+            return Spool(self.deliver, **self.spool_options)
+        except OSError as e:  # Eg. a read-only filesystem: record without the spool rather than not at all
+            print(f"PARAMOUNT: Could not open the recording spool, writing to the database directly: {e}")
+            return None
+
+    def _after_fork(self):
+        """
+        Give a forked child (eg. a gunicorn worker of a --preload app) its own queue, thread and spool directory, as
+        record() and the API keep the writer they got before the fork. What the parent queued is the parent's to write.
+        """
+        self._db_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(self._stats, 0)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        if self.spool is not None:
+            self.spool.close()  # The parent's directory stays locked by the parent
+        self.spool = None
+        self._spool_opened = False
+
+    @property
+    def db_instance(self):
+        if callable(self._db_instance):
+            with self._db_lock:
+                if callable(self._db_instance):  # Raises when it can't be opened: retried with the next delivery
+                    self._db_instance = self._db_instance()
+        return self._db_instance
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        if self.spool is not None:
+            stats['spool'] = self.spool.stats()
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='paramount-writer', daemon=True)
+                self._thread.start()
+
+    def _admit_sample(self):
+        # Admission probability falls linearly from 1 at half capacity to 0 at full capacity
+        fill = self._queue.qsize() / self.queue_size if self.queue_size > 0 else 0
+        if fill <= 0.5:
+            return True
+        return random.random() < (1 - fill) / 0.5
+
+    def submit(self, row, table_name, primary_key):
+        """
+        Enqueue one row for table_name. Returns True if the row was accepted, False if it was dropped.
+        The row is either a dict of column -> value, or a zero-argument callable returning such a dict (or None to
+        skip it): callables are evaluated on the writer thread, which keeps serialization off the caller's thread.
+        """
+        self._ensure_started()
+        item = (table_name, primary_key, row)
+        try:
+            if self.backpressure == 'block':
+                self._queue.put(item, block=True, timeout=self.block_timeout)
+            elif self.backpressure == 'sample' and not self._admit_sample():
+                raise queue.Full
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def submit_nonblocking(self, row, table_name, primary_key):
+        """
+        Like submit(), but safe to call from an event loop: under the 'block' policy the (possibly waiting) put is
+        handed to the loop's default executor instead of blocking the loop.
+        """
+        if self.backpressure == 'block':
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                loop.run_in_executor(None, self.submit, row, table_name, primary_key)
+                return True
+        return self.submit(row, table_name, primary_key)
+
+    def _run(self):
+        pending = {}  # (table_name, primary_key) -> list of rows
+        pending_rows = 0
+        oldest = None
+        while True:
+            if self._stop.is_set():
+                timeout = 0
+            elif oldest is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, oldest + self.flush_interval - monotonic())
+            try:
+                table_name, primary_key, row = self._queue.get(timeout=timeout)
+                pending.setdefault((table_name, primary_key), []).append(row)
+                pending_rows += 1
+                if oldest is None:
+                    oldest = monotonic()
+            except queue.Empty:
+                pass
+
+            due = oldest is not None and monotonic() - oldest >= self.flush_interval
+            draining = self._stop.is_set() and self._queue.empty()
+            if pending_rows >= self.batch_size or due or (draining and pending):
+                self._write(pending)
+                pending, pending_rows, oldest = {}, 0, None
+
+            if draining and not pending:
+                return
+
+    def _materialize(self, rows):
+        materialized = []
+        for row in rows:
+            if callable(row):
+                try:
+                    row = row()
+                except Exception as e:
+                    self._count('failed')
+                    err_tcb = traceback.format_exc()
+                    print(f"PARAMOUNT: Failed to build recording row: {e}: {err_tcb}")
+                    continue
+            if row is None:
+                self._count('skipped')
+            else:
+                materialized.append(row)
+        return materialized
+
+    def _write(self, pending):
+        for (table_name, primary_key), rows in pending.items():
+            rows = self._materialize(rows)
+            if not rows:
+                continue
+            if not self._spool_opened:
+                self.spool = self._open_spool()
+                self._spool_opened = True
+            if self.spool is not None:
+                try:
+                    self.spool.append(table_name, primary_key, rows)
+                    self._count('spooled', len(rows))
+                    continue
+                except Exception as e:  # Eg. a full disk, or values that can't be pickled
+                    print(f"PARAMOUNT: Failed to spool {len(rows)} rows for {table_name}, writing them directly: "
+                          f"{e}: {traceback.format_exc()}")
+            try:
+                self.deliver(table_name, primary_key, rows)
+            except Exception as e:
+                self._count('failed', len(rows))
+                err_tcb = traceback.format_exc()
+                print(f"PARAMOUNT: Failed to write {len(rows)} rows to {table_name}: {e}: {err_tcb}")
+
+    def deliver(self, table_name, primary_key, rows):
+        import pandas as pd  # Deferred until there is something to write: it adds seconds to a cold start
+        # Datetime values carry their tz, so pandas infers timestamptz-compatible dtypes without to_datetime()
+        batch = pd.DataFrame(rows)
+        self.db_instance.create_or_append(batch, table_name, primary_key)
+        self._count('written', len(batch))
+        self._count('batches')
+        for listener in self.write_listeners:
+            listener(table_name)
+
+    def flush(self, timeout=None):
+        """
+        Stop the writer thread once everything queued so far is written (or spooled), then give the spool what is
+        left of timeout to deliver: undelivered rows stay on disk for the next start. Both restart on the next submit().
+        """
+        deadline = monotonic() + timeout if timeout is not None else None
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._stop.set()
+            thread.join(timeout)
+        if self.spool is not None:
+            self.spool.flush(max(0.0, deadline - monotonic()) if deadline is not None else None)
+
+
+_writers = {}  # (database, [record] config) -> RecordingWriter
+_writer_lock = threading.Lock()
+
+
+def spool_options(spool_config):
+    """Spool() arguments from the [record.spool] config section, None when the spool is disabled."""
+    if not spool_config.get('enabled', True):
+        return None
+    return {'directory': spool_config.get('directory', 'paramount_spool'),
+            'segment_bytes': spool_config.get('segment_bytes', 16 * 1024 * 1024),
+            'fsync': spool_config.get('fsync', True),
+            'retry_backoff': spool_config.get('retry_backoff', 1.0),
+            'max_backoff': spool_config.get('max_backoff', 60.0),
+            'max_attempts': spool_config.get('max_attempts', 0)}
+
+
+def get_writer(db_instance, record_config=None, database=None):
+    """
+    Return the process-wide RecordingWriter of a database and [record] config section, creating it on first use.
+    database identifies the database, eg. (db type, connection string), when callers each pass their own
+    db_instance: those with the same database and config share a writer (and its spool), the others get their own.
+    """
+    record_config = record_config or {}
+    key = (database if database is not None else id(db_instance), repr(sorted(record_config.items())))
+    writer = _writers.get(key)
+    if writer is None:
+        with _writer_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                writer = RecordingWriter(db_instance,
+                                         queue_size=record_config.get('queue_size', 10000),
+                                         batch_size=record_config.get('batch_size', 500),
+                                         flush_interval=record_config.get('flush_interval', 1.0),
+                                         backpressure=record_config.get('backpressure', 'drop'),
+                                         block_timeout=record_config.get('block_timeout'),
+                                         spool_options=spool_options(record_config.get('spool', {})))
+                atexit.register(writer.flush, record_config.get('spool', {}).get('shutdown_timeout', 5))
+                _writers[key] = writer
+    return writer
+
+
+def flush_writers(timeout=None):
+    """flush() every writer of the process, eg. before reading back what was recorded."""
+    for writer in list(_writers.values()):
+        writer.flush(timeout)
+
+
+def _reset_after_fork():
+    # The writer threads do not survive a fork: the child keeps the same writers, with their own queues and threads
+    global _writer_lock
+    _writer_lock = threading.Lock()
+    for writer in _writers.values():
+        writer._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
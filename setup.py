@@ -23,5 +23,10 @@ setup(
    },
    packages=find_packages(),
    include_package_data=True,
-   install_requires=['requests', 'pandas', 'pytz', 'flask', 'python-dotenv', 'scikit-learn', 'sqlalchemy', 'psycopg2-binary', 'gunicorn', 'toml']
+   install_requires=['requests', 'pandas>=2.0', 'pytz', 'flask', 'python-dotenv', 'scikit-learn', 'sqlalchemy>=2.0', 'psycopg2-binary', 'gunicorn', 'toml'],
+   extras_require={
+      'arrow': ['pyarrow'],
+      'brotli': ['brotli'],
+      'async': ['gevent', 'psycogreen'],
+   }
 )
@@ -0,0 +1,51 @@
+import sqlite3
+
+from paramount.server.spool import Spool
+
+
+def deliver_failing(errors, delivered):
+    """deliver() raising the given errors, one per attempt, then delivering."""
+    errors = list(errors)
+
+    def deliver(table_name, primary_key, rows):
+        if errors:
+            raise errors.pop(0)
+        delivered.append(rows)
+    return deliver
+
+
+def test_transient_errors_are_retried(tmp_path):
+    delivered = []
+    spool = Spool(deliver_failing([sqlite3.OperationalError('database is locked')] * 2, delivered),
+                  directory=str(tmp_path), retry_backoff=0.01)
+    spool.append('paramount_data', 'paramount__recording_id', [{'a': 1}])
+    spool.flush(5)
+
+    stats = spool.stats()
+    assert delivered == [[{'a': 1}]]
+    assert (stats['retries'], stats['failed_batches'], stats['pending_batches']) == (2, 0, 0)
+
+
+def test_rejected_batches_are_set_aside(tmp_path):
+    delivered = []
+    spool = Spool(deliver_failing([sqlite3.DataError('invalid value')], delivered),
+                  directory=str(tmp_path), retry_backoff=0.01)
+    spool.append('paramount_data', 'paramount__recording_id', [{'a': 1}])
+    spool.append('paramount_data', 'paramount__recording_id', [{'a': 2}])
+    spool.flush(5)
+
+    stats = spool.stats()
+    assert delivered == [[{'a': 2}]]  # The next batch isn't held up
+    assert (stats['retries'], stats['failed_batches'], stats['pending_batches']) == (1, 1, 0)
+    assert (tmp_path / '0' / 'failed.frames').stat().st_size > 0
+
+
+def test_other_errors_are_retried(tmp_path):
+    delivered = []
+    spool = Spool(deliver_failing([ValueError('not about the rows')], delivered),
+                  directory=str(tmp_path), retry_backoff=0.01)
+    spool.append('paramount_data', 'paramount__recording_id', [{'a': 1}])
+    spool.flush(5)
+
+    assert delivered == [[{'a': 1}]]
+    assert spool.stats()['failed_batches'] == 0
@@ -0,0 +1,10 @@
+from paramount.server.writer import get_writer
+
+
+def test_writers_are_shared_by_database_and_config():
+    record_config = {'batch_size': 10, 'spool': {'enabled': False}}
+    writer = get_writer(lambda: None, record_config, database=('csv', 'test-shared'))
+
+    assert get_writer(lambda: None, dict(record_config), database=('csv', 'test-shared')) is writer
+    assert get_writer(lambda: None, record_config, database=('csv', 'test-other')) is not writer
+    assert get_writer(lambda: None, {**record_config, 'batch_size': 20}, database=('csv', 'test-shared')) is not writer